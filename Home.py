@@ -1,6 +1,7 @@
 import streamlit as st
 import style
 import auth_manager
+import plot_setup
 
 # ページ設定
 st.set_page_config(
@@ -12,6 +13,9 @@ st.set_page_config(
 auth_manager.check_auth()
 # ---------------------------------------
 
+# 散布図ツール用のフォントの準備を裏で始めておく (プロセスごとに 1 回)
+plot_setup.warm_up_in_background()
+
 # スタイル適用
 style.apply_custom_style()
 
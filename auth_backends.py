@@ -0,0 +1,282 @@
+# auth_backends.py
+import argparse
+import json
+import os
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# ==========================================
+# 設定
+# ==========================================
+# Firebase Auth REST API のベース URL (エミュレータやローカルの代替サーバーに差し替え可能)
+FIREBASE_IDENTITY_URL = "https://identitytoolkit.googleapis.com"
+FIREBASE_TOKEN_URL = "https://securetoken.googleapis.com"
+
+# (接続, 読み込み) のタイムアウト秒数
+REQUEST_TIMEOUT = (3.05, 10)
+# スタブが発行するトークンの有効期限 (秒)
+STUB_TOKEN_TTL = 3600
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    認証 API 用の requests.Session (プロセス内で共有し、接続を使い回す)
+    接続エラーは少し待って再試行する (送信前の失敗なのでメソッドによらない)
+    読み取りエラーと 5xx の再試行は GET だけ (POST はサーバー側で処理済みの可能性があり、送り直さない)
+    requests は最初の問い合わせ (ログイン送信など) のときに初めて読み込む
+    """
+    global _http_session
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    with _http_session_lock:
+        if _http_session is None:
+            retry = Retry(
+                total=3, connect=3, read=2, backoff_factor=0.3,
+                status_forcelist=[500, 502, 503, 504],
+                allowed_methods=["GET"],
+                raise_on_status=False,
+            )
+            session = requests.Session()
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+    return _http_session
+
+
+class AuthError(Exception):
+    """
+    認証の失敗 (パスワード違いなど)
+    code は Firebase と同じエラーコード (INVALID_PASSWORD など)
+    """
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+# ==========================================
+# バックエンド
+# ==========================================
+class AuthBackend:
+    """
+    認証の実装
+    - sign_in: email, localId, idToken, refreshToken, expiresIn を持つ dict を返す
+    - refresh: idToken, refreshToken, expiresIn を持つ dict を返す
+    失敗時は AuthError を送出する
+    """
+
+    def sign_in(self, email, password):
+        raise NotImplementedError
+
+    def refresh(self, refresh_token):
+        raise NotImplementedError
+
+
+class FirebaseRestBackend(AuthBackend):
+    """
+    Firebase Auth の REST API (signInWithPassword / securetoken)
+    URL を差し替えれば、同じ API を持つローカルの代替サーバーにもつながる
+    """
+
+    def __init__(self, api_key, identity_url=FIREBASE_IDENTITY_URL, token_url=FIREBASE_TOKEN_URL,
+                 timeout=REQUEST_TIMEOUT):
+        self.api_key = api_key
+        self.sign_in_url = identity_url.rstrip("/") + "/v1/accounts:signInWithPassword"
+        self.refresh_url = token_url.rstrip("/") + "/v1/token"
+        self.timeout = timeout
+
+    def _post(self, url, **kwargs):
+        r = get_http_session().post(url, params={"key": self.api_key}, timeout=self.timeout, **kwargs)
+        if r.status_code >= 400:
+            try:
+                code = r.json().get("error", {}).get("message", "Unknown Error")
+            except ValueError:
+                r.raise_for_status()
+            raise AuthError(code)
+        return r.json()
+
+    def sign_in(self, email, password):
+        return self._post(self.sign_in_url, json={
+            "email": email,
+            "password": password,
+            "returnSecureToken": True
+        })
+
+    def refresh(self, refresh_token):
+        data = self._post(self.refresh_url, data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+        })
+        return {
+            "idToken": data["id_token"],
+            "refreshToken": data.get("refresh_token", refresh_token),
+            "expiresIn": data.get("expires_in", "3600"),
+        }
+
+
+class StubBackend(AuthBackend):
+    """
+    プロセス内で完結するスタブ (ネットワークを使わない)
+    users: email -> password。トークンはランダムな文字列を発行する
+    """
+
+    def __init__(self, users, token_ttl=STUB_TOKEN_TTL):
+        self.users = dict(users)
+        self.token_ttl = token_ttl
+        self._refresh_tokens = {}   # refreshToken -> email
+        self._lock = threading.Lock()
+
+    def _issue(self, email):
+        refresh_token = secrets.token_urlsafe(24)
+        with self._lock:
+            self._refresh_tokens[refresh_token] = email
+        return {
+            "idToken": secrets.token_urlsafe(32),
+            "refreshToken": refresh_token,
+            "expiresIn": str(self.token_ttl),
+        }
+
+    def sign_in(self, email, password):
+        if email not in self.users:
+            raise AuthError("EMAIL_NOT_FOUND")
+        if not secrets.compare_digest(str(self.users[email]), str(password)):
+            raise AuthError("INVALID_PASSWORD")
+        result = self._issue(email)
+        result.update({"email": email, "localId": "stub-" + email})
+        return result
+
+    def refresh(self, refresh_token):
+        with self._lock:
+            email = self._refresh_tokens.pop(refresh_token, None)
+        if email is None:
+            raise AuthError("INVALID_REFRESH_TOKEN")
+        return self._issue(email)
+
+
+# ==========================================
+# ローカルの代替サーバー (signInWithPassword / token)
+# ==========================================
+class _AuthHandler(BaseHTTPRequestHandler):
+    backend = None      # make_auth_server でサブクラスごとに設定する
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length).decode("utf-8")
+        path = urlparse(self.path).path
+        try:
+            if path.endswith("/accounts:signInWithPassword"):
+                body = json.loads(raw or "{}")
+                self._send(200, self.backend.sign_in(body.get("email", ""), body.get("password", "")))
+            elif path.endswith("/token"):
+                form = parse_qs(raw)
+                data = self.backend.refresh(form.get("refresh_token", [""])[0])
+                self._send(200, {
+                    "id_token": data["idToken"],
+                    "refresh_token": data["refreshToken"],
+                    "expires_in": data["expiresIn"],
+                })
+            else:
+                self._send(404, {"error": {"code": 404, "message": "NOT_FOUND"}})
+        except AuthError as e:
+            self._send(400, {"error": {"code": 400, "message": e.code}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_auth_server(users, host="127.0.0.1", port=0):
+    """
+    Firebase Auth REST API の一部を真似た HTTP サーバーを作る (serve_forever は呼び出し側で)
+    port=0 なら空いているポートを使う (server.server_address で確認できる)
+    """
+    handler = type("AuthHandler", (_AuthHandler,), {"backend": StubBackend(users)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+# ==========================================
+# 設定からバックエンドを選ぶ
+# ==========================================
+def parse_users(text):
+    """"a@example.com:pass,b@example.com:pass2" 形式のユーザー一覧"""
+    users = {}
+    for item in (text or "").split(","):
+        if ":" in item:
+            email, password = item.split(":", 1)
+            users[email.strip()] = password
+    return users
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(config=None, api_key=None):
+    """
+    設定 (st.secrets["auth"] など) または環境変数から認証バックエンドを作る
+    同じ設定ならプロセス内で使い回す
+    - backend = "firebase" (既定): 本番の Firebase
+    - backend = "http": url の代替サーバー (make_auth_server やエミュレータ)
+    - backend = "stub": プロセス内のスタブ。users (dict または "email:pass,..." 形式)
+    """
+    config = dict(config or {})
+    kind = config.get("backend") or os.environ.get("SCIENCE_TOOLS_AUTH_BACKEND", "firebase")
+    cache_key = (kind, api_key, tuple(sorted((k, str(v)) for k, v in config.items())))
+    with _backends_lock:
+        backend = _backends.get(cache_key)
+        if backend is None:
+            if kind == "firebase":
+                backend = FirebaseRestBackend(api_key)
+            elif kind == "http":
+                url = config.get("url") or os.environ["SCIENCE_TOOLS_AUTH_URL"]
+                backend = FirebaseRestBackend(api_key or "local", identity_url=url, token_url=url)
+            elif kind == "stub":
+                users = config.get("users") or os.environ.get("SCIENCE_TOOLS_AUTH_USERS", "")
+                backend = StubBackend(parse_users(users) if isinstance(users, str) else users)
+            else:
+                raise ValueError(f"不明な認証バックエンドです: {kind}")
+            _backends[cache_key] = backend
+    return backend
+
+
+def main():
+    """ローカルの代替サーバーを起動する (負荷試験・オフライン動作確認用)"""
+    parser = argparse.ArgumentParser(description="Firebase Auth 代替サーバー (signInWithPassword / token)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9099)
+    parser.add_argument("--users", default=os.environ.get("SCIENCE_TOOLS_AUTH_USERS", "test@example.com:password"),
+                        help='"email:pass,email2:pass2" 形式')
+    args = parser.parse_args()
+
+    server = make_auth_server(parse_users(args.users), args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"auth stand-in listening on http://{host}:{port}")
+    print(f"  SCIENCE_TOOLS_AUTH_BACKEND=http SCIENCE_TOOLS_AUTH_URL=http://{host}:{port}")
+    started = time.time()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"stopped after {time.time() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
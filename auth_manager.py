@@ -1,28 +1,50 @@
 import streamlit as st
-import requests
 import time
 import streamlit.components.v1 as components
 
+import auth_backends
+
 # ==========================================
 # 設定 (提供された情報を設定)
 # ==========================================
 # セキュリティ推奨: 本番環境ではこれらを st.secrets に移動してください
+DEFAULT_CONFIG = {}
 
+# 有効期限のこの秒数前になったら IDトークンを更新する
+TOKEN_REFRESH_MARGIN = 300
 
-# Firebase Auth REST API URLs
-# ログイン用
-FIREBASE_AUTH_URL = "https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={}"
+def get_secrets_section(name):
+    """st.secrets の 1 セクション (無ければ None。secrets.toml が無い場合も例外にしない)"""
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        pass
+    return None
 
 def get_config():
     """設定を取得 (st.secretsがあればそれを優先)"""
-    if "firebase" in st.secrets:
-        return st.secrets["firebase"]
+    config = get_secrets_section("firebase")
+    if config is not None:
+        return config
     return DEFAULT_CONFIG
 
+def get_auth_backend():
+    """
+    認証バックエンドを取得
+    st.secrets["auth"] または環境変数 SCIENCE_TOOLS_AUTH_BACKEND で切り替える
+    (既定は Firebase。オフラインの動作確認・負荷試験では stub / http を使う)
+    """
+    return auth_backends.get_backend(get_secrets_section("auth"), api_key=get_config().get("apiKey"))
+
 def inject_analytics():
     """
     Firebase Analytics (GA4) タグを埋め込む
+    ブラウザのセッションごとに 1 回だけ (再実行のたびに iframe を作り直さない)
     """
+    if st.session_state.get('analytics_injected'):
+        return
+    st.session_state['analytics_injected'] = True
     config = get_config()
     ga_id = config.get("measurementId")
     
@@ -48,6 +70,8 @@ def _handle_auth_response(response_json):
     st.session_state['user_email'] = response_json['email']
     st.session_state['localId'] = response_json['localId']
     st.session_state['idToken'] = response_json['idToken']
+    st.session_state['refreshToken'] = response_json.get('refreshToken')
+    st.session_state['token_expires_at'] = time.time() + int(response_json.get('expiresIn', 3600))
     
     st.success("認証成功！ リダイレクトします...")
     time.sleep(0.5)
@@ -70,9 +94,6 @@ def login_form():
             # タブで「ログイン」と「新規登録」を切り替え
             [tab_login] = st.tabs(["ログイン"])
             
-            config = get_config()
-            api_key = config.get("apiKey")
-
             # --- 既存ユーザーログイン ---
             with tab_login:
                 st.caption("登録済みのアカウントでログイン")
@@ -82,21 +103,13 @@ def login_form():
                     submit_login = st.form_submit_button("Sign In", type="primary", use_container_width=True)
 
                 if submit_login:
-                    auth_url = FIREBASE_AUTH_URL.format(api_key)
-                    payload = {
-                        "email": email,
-                        "password": password,
-                        "returnSecureToken": True
-                    }
                     try:
                         with st.spinner("Authenticating..."):
-                            r = requests.post(auth_url, json=payload)
-                            r.raise_for_status()
-                            _handle_auth_response(r.json())
+                            response_json = get_auth_backend().sign_in(email, password)
+                        _handle_auth_response(response_json)
                     
-                    except requests.exceptions.HTTPError as err:
-                        error_json = err.response.json()
-                        error_msg = error_json.get('error', {}).get('message', 'Unknown Error')
+                    except auth_backends.AuthError as err:
+                        error_msg = err.code
                         
                         if error_msg in ["EMAIL_NOT_FOUND", "INVALID_PASSWORD", "INVALID_LOGIN_CREDENTIALS"]:
                             st.error("メールアドレスまたはパスワードが間違っています。")
@@ -118,21 +131,51 @@ def logout_button():
         st.sidebar.markdown("---")
         st.sidebar.caption(f"Logged in as:\n{st.session_state.get('user_email')}")
         if st.sidebar.button("Logout", type="secondary"):
-            st.session_state['is_logged_in'] = False
-            # セッション情報のクリア
-            keys_to_remove = ['user_email', 'localId', 'idToken']
-            for key in keys_to_remove:
-                st.session_state.pop(key, None)
+            clear_session()
             st.rerun()
 
+def clear_session():
+    """ログイン状態とトークンをセッションから消す"""
+    st.session_state['is_logged_in'] = False
+    # セッション情報のクリア
+    keys_to_remove = ['user_email', 'localId', 'idToken', 'refreshToken', 'token_expires_at']
+    for key in keys_to_remove:
+        st.session_state.pop(key, None)
+
+def refresh_token_if_needed():
+    """
+    IDトークンの期限が近ければ、リフレッシュトークンで画面を出さずに更新する
+    更新できなければログアウト扱いにして、ログインフォームを表示させる
+    """
+    if not st.session_state.get('is_logged_in', False):
+        return
+    expires_at = st.session_state.get('token_expires_at')
+    if expires_at is None or time.time() < expires_at - TOKEN_REFRESH_MARGIN:
+        return
+    refresh_token = st.session_state.get('refreshToken')
+    if not refresh_token:
+        clear_session()
+        return
+
+    try:
+        data = get_auth_backend().refresh(refresh_token)
+    except Exception:
+        clear_session()
+        return
+    st.session_state['idToken'] = data['idToken']
+    st.session_state['refreshToken'] = data['refreshToken']
+    st.session_state['token_expires_at'] = time.time() + int(data['expiresIn'])
+
 def check_auth():
     """
     各ページの先頭で呼び出す一括管理関数
-    1. Analytics埋め込み
-    2. ログインチェック (未ログインならstop)
-    3. ログアウトボタン表示
+    1. Analytics埋め込み (セッションごとに 1 回)
+    2. IDトークンの期限確認と更新
+    3. ログインチェック (未ログインならstop)
+    4. ログアウトボタン表示
     """
     inject_analytics()
+    refresh_token_if_needed()
     login_form()
     logout_button()
 
@@ -0,0 +1,102 @@
+# bench_imports.py
+"""
+各ページの import にかかる時間を計測し、重いライブラリが余計に読み込まれていないか確認する
+
+    python bench_imports.py            # 結果を表示
+    python bench_imports.py --check    # 禁止したライブラリが読み込まれたら終了コード 1
+    python bench_imports.py -n 5       # 5 回計測した中央値
+
+ページのスクリプトは実行せず、モジュール直下の import 文だけを新しい Python プロセスで実行する
+(関数の中で遅延 import しているものは含まれない)
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# ページ -> 起動時に読み込まれてはいけないライブラリ
+PAGES = {
+    "Home.py": ["matplotlib", "japanize_matplotlib", "pandas", "numpy", "requests"],
+    "pages/1_散布図作成.py": ["matplotlib", "japanize_matplotlib", "requests"],
+    "pages/2_表作成.py": ["matplotlib", "japanize_matplotlib", "requests"],
+    "pages/3_BibTeX生成.py": ["matplotlib", "japanize_matplotlib", "pandas", "numpy", "requests"],
+}
+
+# 子プロセスで実行するコード (import 文を実行し、かかった時間と読み込まれたモジュールを返す)
+_CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import streamlit
+start = time.perf_counter()
+exec(compile({source!r}, {name!r}, "exec"), {{"__name__": "bench"}})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted({{m.split(".")[0] for m in sys.modules}})}}))
+"""
+
+
+def top_level_imports(path):
+    """
+    ファイル直下 (関数・クラスの外) の import 文だけを取り出したソース
+    try / if の中の import も含める (pages/2 の auth_manager の読み込みなど)
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    def collect(body):
+        for node in body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                yield node
+            elif isinstance(node, ast.Try):
+                yield ast.Try(
+                    body=list(collect(node.body)) or [ast.Pass()],
+                    handlers=[
+                        ast.ExceptHandler(type=h.type, name=h.name, body=list(collect(h.body)) or [ast.Pass()])
+                        for h in node.handlers
+                    ],
+                    orelse=list(collect(node.orelse)),
+                    finalbody=list(collect(node.finalbody)),
+                )
+            elif isinstance(node, ast.If):
+                for child in collect(node.body + node.orelse):
+                    yield child
+
+    module = ast.Module(body=list(collect(tree.body)), type_ignores=[])
+    return ast.unparse(ast.fix_missing_locations(module))
+
+
+def measure(page):
+    """新しいプロセスで 1 回計測する (streamlit 本体の import 時間は含めない)"""
+    path = os.path.join(ROOT, page)
+    code = _CHILD.format(root=ROOT, source=top_level_imports(path), name=path)
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="計測回数 (中央値を表示)")
+    parser.add_argument("--check", action="store_true", help="禁止したライブラリが読み込まれたら失敗する")
+    args = parser.parse_args()
+
+    failed = False
+    for page, forbidden in PAGES.items():
+        runs = [measure(page) for _ in range(args.repeat)]
+        seconds = statistics.median(r["seconds"] for r in runs)
+        loaded = [m for m in forbidden if m in runs[-1]["modules"]]
+        status = "NG " + ", ".join(loaded) if loaded else "ok"
+        print(f"{page:<28} {seconds * 1000:8.1f} ms  {status}")
+        failed = failed or bool(loaded)
+
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
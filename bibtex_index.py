@@ -0,0 +1,198 @@
+# bibtex_index.py
+import hashlib
+import io
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+# start / end はファイル先頭からのバイトオフセット (end は閉じ括弧の次)
+BibEntry = namedtuple("BibEntry", ["entry_type", "key", "start", "end"])
+
+# キーを持たない特殊なエントリ
+SPECIAL_TYPES = {"comment", "preamble", "string"}
+
+READ_CHUNK_SIZE = 1 << 16
+INDEX_CACHE_SIZE = 32
+
+_HEADER_RE = re.compile(rb"@\s*([A-Za-z]+)\s*([{(])")
+_BRACE_RE = re.compile(rb"[{}()]")
+
+
+def iter_entries(stream, chunk_size=READ_CHUNK_SIZE):
+    """
+    バイナリストリームから BibTeX エントリを読み進めながら 1 件ずつ返す
+    - 括弧の対応だけを数えるので、値の中身 (改行・引用符など) は解釈しない
+    - 読み込み途中のエントリは次のチャンクを読んでから続きを走査する
+    """
+    buf = bytearray()
+    base = 0        # buf[0] のファイル先頭からのオフセット
+    eof = False
+
+    def fill():
+        nonlocal eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buf.extend(chunk)
+        return True
+
+    pos = 0
+    while True:
+        at = buf.find(b"@", pos)
+        if at < 0:
+            # '@' が無い部分は捨てる
+            base += len(buf)
+            del buf[:]
+            pos = 0
+            if not fill():
+                return
+            continue
+
+        # 見出し (@type{ / @type( ) が途中で切れていれば続きを読む
+        m = _HEADER_RE.match(buf, at)
+        while m is None and not eof and len(buf) - at < 64:
+            fill()
+            m = _HEADER_RE.match(buf, at)
+        if m is None:
+            pos = at + 1
+            continue
+
+        entry_type = m.group(1).decode("ascii").lower()
+        if entry_type == "comment":
+            # BibTeX と同様に @comment は本体を解釈せず、次の '@' まで読み飛ばす
+            pos = m.end()
+            continue
+        closer = b"}" if m.group(2) == b"{" else b")"
+
+        # 対応する閉じ括弧を探す
+        depth = 0
+        scan = m.end()
+        end = None
+        while end is None:
+            for t in _BRACE_RE.finditer(buf, scan):
+                ch = t.group()
+                if ch == b"{":
+                    depth += 1
+                elif ch == b"}":
+                    if depth == 0 and closer == b"}":
+                        end = t.end()
+                        break
+                    depth -= 1
+                elif ch == b")" and closer == b")" and depth == 0:
+                    end = t.end()
+                    break
+            if end is None:
+                scan = len(buf)
+                if not fill():
+                    # 閉じられていないエントリはファイル末尾までとみなす
+                    end = len(buf)
+
+        key = ""
+        if entry_type not in SPECIAL_TYPES:
+            body = bytes(buf[m.end():end])
+            comma = body.find(b",")
+            key_bytes = body[:comma] if comma >= 0 else body[:-1]
+            key = key_bytes.decode("utf-8", errors="replace").strip()
+
+        yield BibEntry(entry_type, key, base + at, base + end)
+
+        # 処理済みの部分を捨てる
+        del buf[:end]
+        base += end
+        pos = 0
+
+
+class BibIndex:
+    """引用キー -> エントリ の索引"""
+
+    def __init__(self, entries):
+        self.entries = []
+        self._by_key = {}
+        self._by_key_lower = {}
+        for e in entries:
+            self.entries.append(e)
+            if e.key:
+                self._by_key.setdefault(e.key, e)
+                self._by_key_lower.setdefault(e.key.lower(), e)
+
+    def __contains__(self, key):
+        return key.strip() in self._by_key
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def get(self, key):
+        return self._by_key.get(key.strip())
+
+    def get_ignore_case(self, key):
+        """大文字小文字だけが異なるキー (BibTeX では衝突扱いになる)"""
+        return self._by_key_lower.get(key.strip().lower())
+
+    def keys(self):
+        return self._by_key.keys()
+
+
+class BibWriter:
+    """
+    既存の .bib (バイト列) の後ろに新しいエントリを追記した出力を組み立てる
+    - 元のバイト列はデコードもコピーもせず、バイト列のセグメントのリストとして保持する
+    - エントリ間の区切り (空行) は末尾の 2 バイトだけを見て決める
+    """
+
+    def __init__(self, base=b"", encoding="utf-8"):
+        self.encoding = encoding
+        self._segments = [base] if base else []
+        self._size = len(base)
+        self._tail = bytes(base[-2:])
+
+    def append(self, text):
+        """エントリ (文字列) を追記する (既存の内容との間に空行を 1 つ入れる)"""
+        data = text.encode(self.encoding)
+        if not data:
+            return
+        if self._size:
+            if not self._tail.endswith(b"\n"):
+                self._push(b"\n\n")
+            elif self._tail != b"\n\n":
+                self._push(b"\n")
+        self._push(data)
+
+    def _push(self, data):
+        self._segments.append(data)
+        self._size += len(data)
+        self._tail = (self._tail + data)[-2:] if len(data) < 2 else data[-2:]
+
+    def __len__(self):
+        return self._size
+
+    def getvalue(self):
+        """出力全体のバイト列 (ダウンロード時に 1 回だけ連結する)"""
+        if len(self._segments) == 1:
+            return self._segments[0]
+        return b"".join(self._segments)
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def get_index(data):
+    """
+    .bib ファイルのバイト列から索引を作る
+    内容ハッシュでキャッシュするので、同じファイルは一度しか走査しない
+    """
+    digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+    with _index_lock:
+        index = _index_cache.get(digest)
+        if index is not None:
+            _index_cache.move_to_end(digest)
+            return index
+
+    index = BibIndex(iter_entries(io.BytesIO(data)))
+
+    with _index_lock:
+        _index_cache[digest] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
@@ -0,0 +1,279 @@
+# data_loader.py
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import disk_cache
+from series_store import SeriesStore
+
+# ==========================================
+# 設定
+# ==========================================
+# キャッシュ全体の上限サイズ (バイト)。超えた分は古いものから破棄する
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+# ダイジェストのメモ (file_id -> ハッシュ) の保持件数
+DIGEST_MEMO_SIZE = 256
+# これより大きい CSV は列選択用のサンプルだけ先に読み、選択列のみを分割読み込みする
+CSV_STREAM_THRESHOLD_BYTES = 20 * 1024 * 1024
+# 列選択用に読むサンプル行数
+CSV_SAMPLE_ROWS = 1000
+# 分割読み込み 1 回あたりの行数
+CSV_CHUNK_ROWS = 200_000
+# 列指向のバイナリ形式 (ディスクに書き出してメモリマップで読む)
+BINARY_EXTENSIONS = ('.parquet', '.feather', '.npy', '.npz')
+
+
+class ParseCache:
+    """
+    アップロードファイルの解析結果を保持する LRU キャッシュ
+    - キーは (内容ハッシュ, シート名) などの任意のタプル
+    - 合計バイト数が max_bytes を超えたら最も古いエントリから破棄
+    - モジュール変数として保持するため、全セッションで共有される
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[1]
+            # 単体で上限を超えるものはキャッシュしない
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes:
+                _, (_, old_bytes) = self._entries.popitem(last=False)
+                self._total_bytes -= old_bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalFile(io.BytesIO):
+    """
+    ディスク上のファイルを UploadedFile と同じように扱うためのラッパー (CLI 用)
+    name / size / getvalue() / seek() / read() を持つので read_table などにそのまま渡せる
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        super().__init__(data)
+        self.name = os.path.basename(path)
+        self.size = len(data)
+        self.file_id = None
+
+
+_cache = ParseCache()
+_digest_memo = OrderedDict()
+_digest_lock = threading.Lock()
+
+
+def _estimate_nbytes(value):
+    """キャッシュ対象のおおよそのメモリ使用量"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return sum(len(str(v)) for v in value) + 64
+    return 64
+
+
+def file_extension(name):
+    """ファイル名の拡張子 (小文字、ドット付き)。形式の判定はすべてこれで行う"""
+    return os.path.splitext(name)[1].lower()
+
+
+def content_digest(data):
+    """バイト列の内容ハッシュ"""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def upload_digest(uploaded_file):
+    """
+    UploadedFile の内容ハッシュを返す
+    同じアップロード (file_id) に対しては再計算せずメモを返す
+    """
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id is not None:
+        with _digest_lock:
+            digest = _digest_memo.get(file_id)
+            if digest is not None:
+                _digest_memo.move_to_end(file_id)
+                return digest
+
+    digest = content_digest(uploaded_file.getvalue())
+
+    if file_id is not None:
+        with _digest_lock:
+            _digest_memo[file_id] = digest
+            while len(_digest_memo) > DIGEST_MEMO_SIZE:
+                _digest_memo.popitem(last=False)
+    return digest
+
+
+def get_sheet_names(uploaded_file):
+    """xlsx のシート名一覧 (キャッシュ付き)"""
+    key = (upload_digest(uploaded_file), "__sheets__")
+    sheet_names = _cache.get(key)
+    if sheet_names is None:
+        xl = pd.ExcelFile(io.BytesIO(uploaded_file.getvalue()))
+        sheet_names = list(xl.sheet_names)
+        _cache.put(key, sheet_names, _estimate_nbytes(sheet_names))
+    return sheet_names
+
+
+def _numpy_to_frame(arr):
+    """npy 配列を DataFrame にする (構造化配列はフィールド名を列名に使う)"""
+    if arr.dtype.names:
+        return pd.DataFrame({name: arr[name] for name in arr.dtype.names})
+    if arr.ndim == 1:
+        arr = arr.reshape(-1, 1)
+    if arr.ndim != 2:
+        raise ValueError(f"1 次元または 2 次元の配列のみ対応しています (ndim={arr.ndim})")
+    return pd.DataFrame(arr, columns=[f"列 {i+1}" for i in range(arr.shape[1])], copy=False)
+
+
+def _read_binary(uploaded_file, ext):
+    """
+    Parquet / Feather / npy / npz を読む
+    アップロードを一度ディスクに書き出し、可能な形式はメモリマップで開く
+    Parquet / Feather は Arrow の列をそのまま参照する DataFrame (ArrowDtype) にする
+    (非圧縮の Feather はメモリマップしたファイルをコピーせずに使う。
+     Parquet は展開が必要なので Arrow のバッファは確保されるが、pandas 側への 2 回目のコピーはしない)
+    欠損は NaN ではなく pd.NA になる
+    """
+    path = disk_cache.spool_upload(upload_digest(uploaded_file), ext, uploaded_file.getvalue())
+
+    if ext == '.npy':
+        return _numpy_to_frame(np.load(path, mmap_mode='r', allow_pickle=False))
+    if ext == '.npz':
+        # zip 内の配列はメモリマップできないので展開して読む
+        with np.load(path, allow_pickle=False) as z:
+            return pd.DataFrame({name: pd.Series(z[name].ravel()) for name in z.files})
+
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet / Feather の読み込みには pyarrow が必要です。")
+    if ext == '.parquet':
+        table = pq.read_table(path, memory_map=True)
+    else:
+        # 非圧縮の Feather (Arrow IPC) ならゼロコピーで参照される
+        table = feather.read_table(path, memory_map=True)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_table(uploaded_file, sheet_name=None):
+    """
+    CSV / xlsx / Parquet / Feather / npy / npz を DataFrame として読み込む (キャッシュ付き)
+    返り値はセッション間で共有されるため、呼び出し側で書き換えないこと
+    """
+    key = (upload_digest(uploaded_file), sheet_name)
+    df = _cache.get(key)
+    if df is None:
+        ext = file_extension(uploaded_file.name)
+        if ext in BINARY_EXTENSIONS:
+            df = _read_binary(uploaded_file, ext)
+        elif ext == '.xlsx':
+            df = pd.read_excel(io.BytesIO(uploaded_file.getvalue()), sheet_name=sheet_name)
+        else:
+            df = pd.read_csv(io.BytesIO(uploaded_file.getvalue()))
+        _cache.put(key, df, _estimate_nbytes(df))
+    return df
+
+
+def read_csv_sample(uploaded_file, nrows=CSV_SAMPLE_ROWS):
+    """ヘッダーと先頭 nrows 行だけを読む (列選択 UI 用)"""
+    key = (upload_digest(uploaded_file), "__csv_sample__", nrows)
+    df = _cache.get(key)
+    if df is None:
+        uploaded_file.seek(0)
+        df = pd.read_csv(uploaded_file, nrows=nrows)
+        _cache.put(key, df, _estimate_nbytes(df))
+    return df
+
+
+def read_csv_columns(uploaded_file, columns, dtype=np.float64, chunksize=CSV_CHUNK_ROWS):
+    """
+    CSV から指定列だけを分割読み込みし、列名 -> 数値配列 (欠損は NaN) の dict を返す
+    全列の DataFrame を作らないため、ピークメモリは選択列の大きさ程度で済む
+    """
+    columns = list(dict.fromkeys(columns))
+    key = (upload_digest(uploaded_file), "__csv_columns__", tuple(columns), np.dtype(dtype).str)
+    arrays = _cache.get(key)
+    if arrays is not None:
+        return arrays
+
+    parts = {col: [] for col in columns}
+    uploaded_file.seek(0)
+    for chunk in pd.read_csv(uploaded_file, usecols=columns, chunksize=chunksize):
+        for col in columns:
+            parts[col].append(
+                pd.to_numeric(chunk[col], errors='coerce').to_numpy(dtype=dtype, na_value=np.nan)
+            )
+    arrays = {
+        col: np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+        for col, chunks in parts.items()
+    }
+    _cache.put(key, arrays, sum(a.nbytes for a in arrays.values()))
+    return arrays
+
+
+def get_series_store(key, build):
+    """
+    系列ストアを取得する
+    1. プロセス内キャッシュ
+    2. ディスク上の保存済みデータ (メモリマップ: 他セッション・他プロセスと同じページを共有)
+    3. build() で構築し、ディスクに保存してからメモリマップで開き直す
+    """
+    store = _cache.get(key)
+    if store is not None:
+        return store
+
+    disk_key = content_digest(repr(key).encode("utf-8"))
+    loaded = disk_cache.load_arrays(disk_key)
+    if loaded is None:
+        store = build()
+        if not store.empty:
+            try:
+                disk_cache.save_arrays(disk_key, *store.to_arrays())
+                loaded = disk_cache.load_arrays(disk_key)
+            except OSError:
+                # ディスクに書けない環境ではメモリ上のストアをそのまま使う
+                loaded = None
+    if loaded is not None:
+        store = SeriesStore.from_arrays(*loaded)
+
+    _cache.put(key, store, _estimate_nbytes(store))
+    return store
+
@@ -0,0 +1,218 @@
+# disk_cache.py
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+# ==========================================
+# 設定
+# ==========================================
+# 解析済みデータを置くディレクトリ (同じマシン上の全セッション・全プロセスで共有)
+SPOOL_DIR = os.environ.get(
+    "SCIENCE_TOOLS_SPOOL_DIR",
+    os.path.join(tempfile.gettempdir(), "science_tools_spool")
+)
+# ディスク上の合計サイズの上限 (バイト)。超えたら最後に使われたのが古いものから削除する
+SPOOL_MAX_BYTES = int(os.environ.get("SCIENCE_TOOLS_SPOOL_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+# これより長く使われていないものは上限に関係なく削除する (秒)
+SPOOL_MAX_AGE_SECONDS = int(os.environ.get("SCIENCE_TOOLS_SPOOL_MAX_AGE", 7 * 24 * 3600))
+# 書きかけのまま残った一時ファイル・ディレクトリ (プロセスが落ちた場合など) を削除するまでの時間 (秒)
+STALE_TMP_SECONDS = 3600
+# 掃除はプロセスごとに、この間隔 (秒) より頻繁には行わない
+PRUNE_INTERVAL_SECONDS = 60
+
+MANIFEST_NAME = "manifest.json"
+UPLOADS_DIR = "uploads"
+TMP_PREFIX = ".tmp-"
+
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def _entry_dir(key):
+    return os.path.join(SPOOL_DIR, key)
+
+
+def _touch(path):
+    """最終使用時刻 (mtime) を更新する (LRU の順序に使う)"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def spool_upload(digest, suffix, data):
+    """
+    アップロードされたバイト列をディスクに書き出し、そのパスを返す
+    (同じ内容なら既存ファイルをそのまま使う)
+    """
+    path = os.path.join(SPOOL_DIR, UPLOADS_DIR, digest + suffix)
+    if os.path.exists(path):
+        _touch(path)
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=TMP_PREFIX)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    maybe_prune()
+    return path
+
+
+def save_arrays(key, arrays, meta=None):
+    """
+    名前 -> 配列 の dict を .npy 群として保存する
+    一時ディレクトリに書いてから rename するので、読み手が書きかけを見ることはない
+    """
+    final_dir = _entry_dir(key)
+    if os.path.exists(os.path.join(final_dir, MANIFEST_NAME)):
+        return
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=SPOOL_DIR, prefix=TMP_PREFIX)
+    try:
+        names = []
+        for i, (name, arr) in enumerate(arrays.items()):
+            np.save(os.path.join(tmp_dir, f"{i}.npy"), np.ascontiguousarray(arr), allow_pickle=False)
+            names.append(name)
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump({"names": names, "meta": meta or {}}, f, ensure_ascii=False)
+        try:
+            os.rename(tmp_dir, final_dir)
+        except OSError:
+            # 他のセッションが先に保存した場合はそちらを使う
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    maybe_prune()
+
+
+def load_arrays(key):
+    """
+    save_arrays で保存した配列をメモリマップ (読み取り専用) で開く
+    無ければ (掃除で削除された直後も含めて) None を返す
+    """
+    entry_dir = _entry_dir(key)
+    manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(entry_dir, f"{i}.npy"), mmap_mode="r", allow_pickle=False)
+            for i, name in enumerate(manifest["names"])
+        }
+    except FileNotFoundError:
+        return None
+    _touch(manifest_path)
+    return arrays, manifest["meta"]
+
+
+# ==========================================
+# 掃除 (サイズ・経過時間の上限による LRU 削除)
+# ==========================================
+def _path_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path):
+    """
+    エントリを削除する
+    ディレクトリは先に一時名へ rename してから消すので、読み手が消しかけのエントリを見ることはない
+    (POSIX では、メモリマップ中のファイルを削除しても開いている側はそのまま読める)
+    """
+    if os.path.isdir(path):
+        doomed = os.path.join(SPOOL_DIR, f"{TMP_PREFIX}del-{uuid.uuid4().hex}")
+        try:
+            os.rename(path, doomed)
+        except OSError:
+            return
+        shutil.rmtree(doomed, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _entries():
+    """
+    掃除の対象 [(パス, 最終使用時刻, サイズ, 一時ファイルか), ...]
+    保存済みの配列はマニフェストの mtime、アップロードはファイル自体の mtime を最終使用時刻とする
+    """
+    entries = []
+    dirs = [SPOOL_DIR, os.path.join(SPOOL_DIR, UPLOADS_DIR)]
+    for base in dirs:
+        try:
+            names = os.listdir(base)
+        except OSError:
+            continue
+        for name in names:
+            path = os.path.join(base, name)
+            if path == dirs[1]:
+                continue
+            try:
+                marker = os.path.join(path, MANIFEST_NAME) if os.path.isdir(path) else path
+                if not os.path.exists(marker):
+                    marker = path
+                entries.append((path, os.path.getmtime(marker), _path_size(path), name.startswith(TMP_PREFIX)))
+            except OSError:
+                # 他のプロセスが同時に削除した
+                continue
+    return entries
+
+
+def prune(max_bytes=SPOOL_MAX_BYTES, max_age=SPOOL_MAX_AGE_SECONDS, now=None):
+    """
+    スプールディレクトリを上限内に収める
+    1. STALE_TMP_SECONDS より古い書きかけの一時ファイル・ディレクトリを削除
+    2. max_age 秒以上使われていないエントリを削除
+    3. 合計が max_bytes を超えていれば、最後に使われたのが古いものから削除
+    返り値: 削除したバイト数
+    """
+    now = time.time() if now is None else now
+    removed = 0
+    kept = []
+    for path, used_at, size, is_tmp in _entries():
+        age = now - used_at
+        if (is_tmp and age > STALE_TMP_SECONDS) or (not is_tmp and age > max_age):
+            _remove(path)
+            removed += size
+        elif not is_tmp:
+            kept.append((used_at, size, path))
+
+    total = sum(size for _, size, _ in kept)
+    for used_at, size, path in sorted(kept):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+        removed += size
+    return removed
+
+
+def maybe_prune():
+    """書き込みのたびに呼ぶ。PRUNE_INTERVAL_SECONDS に 1 回だけ prune() を実行する"""
+    global _last_prune
+    now = time.time()
+    with _prune_lock:
+        if now - _last_prune < PRUNE_INTERVAL_SECONDS:
+            return
+        _last_prune = now
+    try:
+        prune(now=now)
+    except OSError:
+        pass
@@ -0,0 +1,394 @@
+# doi_resolver.py
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+# ==========================================
+# 設定
+# ==========================================
+# 取得結果のキャッシュ (同じマシン上の全セッション・全プロセスで共有)
+# 未設定なら一時ディレクトリの CACHE_DIR_NAME の下に置く
+# (disk_cache.SPOOL_DIR の中に置くと、スプールの掃除で DB や -wal / -shm が消される)
+CACHE_PATH = os.environ.get("SCIENCE_TOOLS_METADATA_CACHE")
+CACHE_DIR_NAME = "science_tools_metadata"
+CACHE_FILE_NAME = "metadata_cache.sqlite3"
+CACHE_TTL_SECONDS = 90 * 24 * 3600      # 取得できた書誌情報の有効期限
+MISS_TTL_SECONDS = 24 * 3600            # 「見つからなかった」結果の有効期限
+BATCH_SIZE = 50                         # バックエンドへの 1 回の問い合わせで送る件数
+REQUEST_TIMEOUT = 10
+
+CROSSREF_URL = "https://api.crossref.org"
+OPENLIBRARY_URL = "https://openlibrary.org"
+
+_DOI_RE = re.compile(r"(10\.\d{4,9}/\S+)")
+
+# CSL-JSON の type -> BibTeX のエントリタイプ
+CSL_TYPES = {
+    "journal-article": "article",
+    "article-journal": "article",
+    "book": "book",
+    "monograph": "book",
+    "edited-book": "book",
+    "proceedings-article": "inproceedings",
+    "paper-conference": "inproceedings",
+    "dissertation": "phdthesis",
+    "thesis": "phdthesis",
+    "report": "techreport",
+    "webpage": "website",
+}
+
+
+# ==========================================
+# 識別子の正規化
+# ==========================================
+def normalize_identifier(text):
+    """
+    DOI / ISBN の入力を "doi:10.xxx/yyy" / "isbn:978..." の形にそろえる
+    解釈できなければ None を返す
+    """
+    if text is None:
+        return None
+    text = str(text).strip()
+    if not text:
+        return None
+    m = _DOI_RE.search(text)
+    if m:
+        # DOI は大文字小文字を区別しない
+        return "doi:" + m.group(1).rstrip(".,;").lower()
+    digits = re.sub(r"[^0-9Xx]", "", re.sub(r"(?i)^isbn[:\s]*", "", text)).upper()
+    if len(digits) == 13 and digits.isdigit():
+        return "isbn:" + digits
+    if len(digits) == 10 and digits[:9].isdigit():
+        return "isbn:" + isbn10_to_13(digits)
+    return None
+
+
+def isbn10_to_13(isbn10):
+    """ISBN-10 を ISBN-13 に変換する (キャッシュのキーを 1 つにそろえるため)"""
+    core = "978" + isbn10[:9]
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(core))
+    return core + str((10 - total % 10) % 10)
+
+
+# ==========================================
+# CSL-JSON -> BibTeX フィールド
+# ==========================================
+def _csl_names(names):
+    parts = []
+    for a in names or []:
+        if a.get("family"):
+            parts.append(f"{a['family']}, {a['given']}" if a.get("given") else a["family"])
+        elif a.get("literal") or a.get("name"):
+            parts.append(a.get("literal") or a.get("name"))
+    return " and ".join(parts)
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else ""
+    return value or ""
+
+
+def csl_to_bibtex(record):
+    """CSL-JSON (Crossref などの形式) を (エントリタイプ, フィールド) に変換する"""
+    entry_type = CSL_TYPES.get(record.get("type"), "misc")
+    fields = {
+        "author": _csl_names(record.get("author")),
+        "title": _first(record.get("title")),
+        "volume": str(record.get("volume", "")),
+        "number": str(record.get("issue", "")),
+        "pages": str(record.get("page", "")).replace("-", "--"),
+        "publisher": record.get("publisher", ""),
+        "doi": record.get("DOI", ""),
+        "url": record.get("URL", ""),
+    }
+    for key in ("issued", "published-print", "published-online", "created"):
+        parts = (record.get(key) or {}).get("date-parts") or [[]]
+        if parts[0] and parts[0][0]:
+            fields["year"] = str(parts[0][0])
+            break
+    container = _first(record.get("container-title"))
+    if entry_type == "article":
+        fields["journal"] = container
+    elif entry_type == "inproceedings":
+        fields["booktitle"] = container
+    if record.get("ISBN"):
+        fields["isbn"] = _first(record["ISBN"])
+    return entry_type, {k: v for k, v in fields.items() if v}
+
+
+def openlibrary_to_bibtex(record):
+    """Open Library の books API (jscmd=data) の結果を (エントリタイプ, フィールド) に変換する"""
+    fields = {
+        "author": " and ".join(a["name"] for a in record.get("authors", []) if a.get("name")),
+        "title": record.get("title", ""),
+        "publisher": ", ".join(p["name"] for p in record.get("publishers", []) if p.get("name")),
+        "address": ", ".join(p["name"] for p in record.get("publish_places", []) if p.get("name")),
+        "url": record.get("url", ""),
+    }
+    m = re.search(r"\d{4}", record.get("publish_date", ""))
+    if m:
+        fields["year"] = m.group()
+    return "book", {k: v for k, v in fields.items() if v}
+
+
+# ==========================================
+# バックエンド
+# ==========================================
+class MetadataBackend:
+    """
+    書誌情報の取得元
+    lookup_many(ids) は 正規化済み識別子 -> (エントリタイプ, フィールド) の dict を返す
+    (見つからなかった識別子は dict に含めない)
+    """
+
+    def lookup_many(self, ids):
+        raise NotImplementedError
+
+
+class WebBackend(MetadataBackend):
+    """
+    Crossref (DOI) と Open Library (ISBN) の REST API
+    base URL を差し替えれば、同じ API を真似たローカルのスタブサーバーも使える
+    """
+
+    def __init__(self, crossref_url=CROSSREF_URL, openlibrary_url=OPENLIBRARY_URL,
+                 mailto=None, timeout=REQUEST_TIMEOUT):
+        self.crossref_url = crossref_url.rstrip("/")
+        self.openlibrary_url = openlibrary_url.rstrip("/")
+        self.timeout = timeout
+        # requests は実際に問い合わせる設定のときだけ読み込む
+        import requests
+        self.session = requests.Session()
+        agent = "science-tools-bibtex/1.0"
+        if mailto:
+            # Crossref の polite pool を使う
+            agent += f" (mailto:{mailto})"
+        self.session.headers["User-Agent"] = agent
+
+    def lookup_many(self, ids):
+        dois = [i[4:] for i in ids if i.startswith("doi:")]
+        isbns = [i[5:] for i in ids if i.startswith("isbn:")]
+        found = {}
+        if dois:
+            found.update(self._crossref(dois))
+        if isbns:
+            found.update(self._openlibrary(isbns))
+        return found
+
+    def _crossref(self, dois):
+        # filter=doi:a,doi:b,... で複数の DOI を 1 回で問い合わせる
+        r = self.session.get(
+            f"{self.crossref_url}/works",
+            params={"filter": ",".join(f"doi:{d}" for d in dois), "rows": len(dois)},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        found = {}
+        for item in r.json().get("message", {}).get("items", []):
+            doi = item.get("DOI", "").lower()
+            if doi:
+                found["doi:" + doi] = csl_to_bibtex(item)
+        return found
+
+    def _openlibrary(self, isbns):
+        r = self.session.get(
+            f"{self.openlibrary_url}/api/books",
+            params={"bibkeys": ",".join(f"ISBN:{i}" for i in isbns), "format": "json", "jscmd": "data"},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        found = {}
+        for bibkey, item in r.json().items():
+            found["isbn:" + bibkey.split(":", 1)[1]] = openlibrary_to_bibtex(item)
+        return found
+
+
+class LocalDumpBackend(MetadataBackend):
+    """
+    ローカルの書誌データ (CSL-JSON の JSON Lines、1 行 1 レコード) から引く
+    DOI と ISBN の両方で索引を作る。ファイルは最初の問い合わせ時に 1 回だけ読む
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._records is None:
+                records = {}
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        item = json.loads(line)
+                        converted = None
+                        for raw in [item.get("DOI")] + [f"isbn:{x}" for x in item.get("ISBN", [])]:
+                            ident = normalize_identifier(raw)
+                            if ident:
+                                converted = converted or csl_to_bibtex(item)
+                                records[ident] = converted
+                self._records = records
+        return self._records
+
+    def lookup_many(self, ids):
+        records = self._load()
+        return {i: records[i] for i in ids if i in records}
+
+
+# ==========================================
+# 永続キャッシュ
+# ==========================================
+def default_cache_path():
+    """既定のキャッシュファイル (スプールとは別のディレクトリ。TTL は CACHE_TTL_SECONDS だけで決まる)"""
+    return os.path.join(tempfile.gettempdir(), CACHE_DIR_NAME, CACHE_FILE_NAME)
+
+class MetadataCache:
+    """
+    識別子 -> 書誌情報 の SQLite キャッシュ (TTL 付き)
+    見つからなかった結果も短めの TTL で覚えておき、同じ問い合わせを繰り返さない
+    """
+
+    def __init__(self, path=None, ttl=CACHE_TTL_SECONDS, miss_ttl=MISS_TTL_SECONDS):
+        if path is None:
+            path = CACHE_PATH or default_cache_path()
+        self.path = path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                " id TEXT PRIMARY KEY, payload TEXT, fetched_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # 接続は呼び出しごとに開く (スレッド・プロセスをまたいで安全に使える)
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, ids):
+        """
+        キャッシュにある有効な結果を返す
+        返り値: 識別子 -> (エントリタイプ, フィールド) または None (見つからなかった記録)
+        """
+        if not ids:
+            return {}
+        now = time.time()
+        found = {}
+        conn = self._connect()
+        try:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT id, payload, fetched_at FROM metadata WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for ident, payload, fetched_at in rows:
+                    ttl = self.ttl if payload is not None else self.miss_ttl
+                    if now - fetched_at <= ttl:
+                        found[ident] = tuple(json.loads(payload)) if payload is not None else None
+        finally:
+            conn.close()
+        return found
+
+    def put_many(self, results):
+        """識別子 -> (エントリタイプ, フィールド) または None をまとめて保存する"""
+        if not results:
+            return
+        now = time.time()
+        rows = [
+            (ident, json.dumps(value, ensure_ascii=False) if value is not None else None, now)
+            for ident, value in results.items()
+        ]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)", rows)
+        finally:
+            conn.close()
+
+
+# ==========================================
+# リゾルバ
+# ==========================================
+class MetadataResolver:
+    """キャッシュを先に引き、無いものだけをまとめてバックエンドに問い合わせる"""
+
+    def __init__(self, backend, cache=None, batch_size=BATCH_SIZE):
+        self.backend = backend
+        self.cache = cache
+        self.batch_size = batch_size
+
+    def resolve_many(self, identifiers):
+        """
+        DOI / ISBN (表記ゆれ可) のリストを一括で解決する
+        返り値: 入力文字列 -> (エントリタイプ, フィールド) (解決できなかったものは含めない)
+        """
+        ids = {}
+        for text in identifiers:
+            ident = normalize_identifier(text)
+            if ident:
+                ids.setdefault(ident, []).append(text)
+        unique = list(ids)
+
+        results = self.cache.get_many(unique) if self.cache is not None else {}
+        missing = [i for i in unique if i not in results]
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start:start + self.batch_size]
+            found = self.backend.lookup_many(chunk)
+            fetched = {i: found.get(i) for i in chunk}
+            if self.cache is not None:
+                self.cache.put_many(fetched)
+            results.update(fetched)
+
+        resolved = {}
+        for ident, texts in ids.items():
+            value = results.get(ident)
+            if value is not None:
+                for text in texts:
+                    resolved[text] = (value[0], dict(value[1]))
+        return resolved
+
+    def resolve(self, identifier):
+        return self.resolve_many([identifier]).get(identifier)
+
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+
+def get_resolver(config=None):
+    """
+    設定からリゾルバを作る (同じ設定ならプロセス内で使い回す)
+    config (st.secrets["metadata"] など) または環境変数で取得元を選ぶ
+    - backend = "web" (既定): crossref_url / openlibrary_url / mailto
+    - backend = "local": path (CSL-JSON の JSON Lines)
+    """
+    config = dict(config or {})
+    backend = config.get("backend") or os.environ.get("SCIENCE_TOOLS_METADATA_BACKEND", "web")
+    cache_key = (backend, tuple(sorted((k, str(v)) for k, v in config.items())))
+    with _resolvers_lock:
+        resolver = _resolvers.get(cache_key)
+        if resolver is None:
+            if backend == "local":
+                path = config.get("path") or os.environ["SCIENCE_TOOLS_METADATA_DUMP"]
+                impl = LocalDumpBackend(path)
+            elif backend == "web":
+                impl = WebBackend(
+                    crossref_url=config.get("crossref_url") or os.environ.get("SCIENCE_TOOLS_CROSSREF_URL", CROSSREF_URL),
+                    openlibrary_url=config.get("openlibrary_url") or os.environ.get("SCIENCE_TOOLS_OPENLIBRARY_URL", OPENLIBRARY_URL),
+                    mailto=config.get("mailto"),
+                )
+            else:
+                raise ValueError(f"不明な書誌情報の取得元です: {backend}")
+            resolver = MetadataResolver(impl, MetadataCache(config.get("cache_path")))
+            _resolvers[cache_key] = resolver
+    return resolver
@@ -0,0 +1,63 @@
+# downsample.py
+import numpy as np
+
+# プレビュー 1 枚あたりに描く点数の上限 (全系列合計)
+PREVIEW_POINT_BUDGET = 20000
+
+
+def minmax_downsample(x, y, n_buckets):
+    """
+    X ソート済みの系列を X 方向に n_buckets 個の区間へ分け、
+    各区間の Y 最小点・最大点 (と系列の両端) だけを残すインデックスを返す
+    見た目の外形 (ピーク・谷) を保ったまま点数を 2 * n_buckets 程度に減らす
+    """
+    n = x.size
+    if n <= 2 * n_buckets or n_buckets < 1:
+        return np.arange(n)
+    x_min, x_max = x[0], x[-1]
+    if not (np.isfinite(x_min) and np.isfinite(x_max)) or x_max == x_min:
+        # X 幅が無い場合は等間隔で間引く
+        return np.unique(np.linspace(0, n - 1, 2 * n_buckets).astype(np.int64))
+
+    bucket = ((x - x_min) * (n_buckets / (x_max - x_min))).astype(np.int64)
+    np.clip(bucket, 0, n_buckets - 1, out=bucket)
+
+    # X はソート済みなので各区間は連続している
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    seg = np.repeat(np.arange(starts.size), np.diff(np.r_[starts, n]))
+    y_min = np.minimum.reduceat(y, starts)
+    y_max = np.maximum.reduceat(y, starts)
+
+    # 区間ごとに最小値・最大値を取る最初の点
+    is_min = y == y_min[seg]
+    is_max = y == y_max[seg]
+    _, first_min = np.unique(seg[is_min], return_index=True)
+    _, first_max = np.unique(seg[is_max], return_index=True)
+    idx_min = np.flatnonzero(is_min)[first_min]
+    idx_max = np.flatnonzero(is_max)[first_max]
+
+    return np.unique(np.concatenate([[0, n - 1], idx_min, idx_max]))
+
+
+def preview_series(store, budget=PREVIEW_POINT_BUDGET):
+    """
+    SeriesStore の各系列を、全体で約 budget 点に収まるよう間引いた (x, y) のリスト
+    結果は store ごとにキャッシュする
+    """
+    key = ("preview", budget)
+    cached = store.derived.get(key)
+    if cached is not None:
+        return cached
+
+    n_series = len(store)
+    n_buckets = max(1, budget // (2 * max(n_series, 1)))
+    result = []
+    for i in range(n_series):
+        x, y = store.series(i)
+        idx = minmax_downsample(x, y, n_buckets)
+        if idx.size == x.size:
+            result.append((x, y))
+        else:
+            result.append((x[idx], y[idx]))
+    store.derived[key] = result
+    return result
@@ -0,0 +1,433 @@
+# fitting.py
+import math
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+# 各フィールドは shape = (系列数, 範囲数) の配列
+LinearFitResult = namedtuple(
+    "LinearFitResult",
+    ["slope", "intercept", "r2", "slope_err", "intercept_err", "n", "valid"]
+)
+
+
+class LinearFitEngine:
+    """
+    X ソート済みの SeriesStore に対して、任意の X 範囲の直線近似を一括で求める
+    - x, y, xy, x², y² の累積和を 1 回だけ計算しておき、
+      範囲の端点は searchsorted で求めるので 1 範囲あたり O(log n)
+    - 桁落ちを抑えるため、累積和は系列ごとの平均で中心化した値で取る
+    """
+
+    def __init__(self, store):
+        self.store = store
+        offsets = store.offsets
+        n_series = len(store)
+
+        # 系列ごとの中心 (平均)
+        counts = np.diff(offsets)
+        if n_series:
+            self.cx = np.add.reduceat(store.x, offsets[:-1]) / counts
+            self.cy = np.add.reduceat(store.y, offsets[:-1]) / counts
+        else:
+            self.cx = np.zeros(0)
+            self.cy = np.zeros(0)
+        seg_id = np.repeat(np.arange(n_series), counts)
+        xc = store.x - self.cx[seg_id]
+        yc = store.y - self.cy[seg_id]
+
+        # 先頭に 0 を付けた累積和 (区間 [lo, hi) の和 = S[hi] - S[lo])
+        def prefix(v):
+            out = np.zeros(v.size + 1)
+            np.cumsum(v, out=out[1:])
+            return out
+
+        self.sx = prefix(xc)
+        self.sy = prefix(yc)
+        self.sxx = prefix(xc * xc)
+        self.sxy = prefix(xc * yc)
+        self.syy = prefix(yc * yc)
+
+    def bounds(self, ranges):
+        """各系列・各範囲 [x_min, x_max] に含まれる点のインデックス区間 [lo, hi)"""
+        return range_bounds(self.store, ranges)
+
+    def fit(self, ranges, x_factor=1.0, y_factor=1.0):
+        """
+        ranges: [(x_min, x_max), ...] (スケール後の X 座標)
+        x_factor, y_factor: 表示用スケール係数 (正の値)
+        返り値の傾き・切片もスケール後の座標系で表す
+        """
+        ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+        lo, hi = self.bounds(ranges / x_factor)
+        hi = np.maximum(hi, lo)
+
+        n = (hi - lo).astype(float)
+        sum_x = self.sx[hi] - self.sx[lo]
+        sum_y = self.sy[hi] - self.sy[lo]
+        sum_xx = self.sxx[hi] - self.sxx[lo]
+        sum_xy = self.sxy[hi] - self.sxy[lo]
+        sum_yy = self.syy[hi] - self.syy[lo]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_x = sum_x / n
+            mean_y = sum_y / n
+            dxx = sum_xx - sum_x * mean_x
+            dxy = sum_xy - sum_x * mean_y
+            dyy = sum_yy - sum_y * mean_y
+
+            slope = dxy / dxx
+            # 中心化前の座標に戻す
+            mean_x_abs = mean_x + self.cx[:, None]
+            intercept = mean_y + self.cy[:, None] - slope * mean_x_abs
+
+            r2 = np.where(dyy > 0, dxy * dxy / (dxx * dyy), 1.0)
+            sse = np.maximum(dyy - slope * dxy, 0.0)
+            s2 = sse / (n - 2)
+            slope_err = np.sqrt(s2 / dxx)
+            intercept_err = np.sqrt(s2 * (1.0 / n + mean_x_abs ** 2 / dxx))
+
+        valid = (n >= 2) & (dxx > 0)
+        # 2 点だけの場合は誤差を定義できない
+        slope_err = np.where(n > 2, slope_err, np.nan)
+        intercept_err = np.where(n > 2, intercept_err, np.nan)
+
+        return LinearFitResult(
+            slope=np.where(valid, slope * y_factor / x_factor, np.nan),
+            intercept=np.where(valid, intercept * y_factor, np.nan),
+            r2=np.where(valid, r2, np.nan),
+            slope_err=np.where(valid, slope_err * y_factor / x_factor, np.nan),
+            intercept_err=np.where(valid, intercept_err * y_factor, np.nan),
+            n=(hi - lo),
+            valid=valid,
+        )
+
+
+def get_engine(store):
+    """
+    store ごとに 1 回だけ累積和を計算して使い回す
+    store はセッション間で共有されるので、ロックを取って二重に計算しない
+    """
+    engine = store.derived.get("linear_fit")
+    if engine is not None:
+        return engine
+    # dict.setdefault は不可分なので、全スレッドが同じロックを得る
+    lock = store.derived.setdefault("linear_fit_lock", threading.Lock())
+    with lock:
+        engine = store.derived.get("linear_fit")
+        if engine is None:
+            engine = LinearFitEngine(store)
+            store.derived["linear_fit"] = engine
+    return engine
+
+
+# ==========================================
+# 直線以外のモデル (多項式・重み付き・ロバスト・指数・べき)
+# ==========================================
+# モデル名 -> 表示名
+FIT_MODELS = {
+    "linear": "直線",
+    "poly": "多項式",
+    "huber": "直線 (Huber ロバスト)",
+    "ransac": "直線 (RANSAC ロバスト)",
+    "exp": "指数関数 y = A exp(Bx)",
+    "power": "べき関数 y = A x^B",
+}
+MAX_POLY_DEGREE = 5
+
+HUBER_K = 1.345             # Huber 関数の閾値 (残差の標準偏差に対する倍率)
+HUBER_MAX_ITER = 30
+HUBER_TOLERANCE = 1e-6       # 係数の相対変化がこれ未満になったら打ち切る
+RANSAC_TRIALS = 200         # 1 範囲あたりに試す 2 点の組の数
+RANSAC_THRESHOLD = 2.5      # インライアとみなす残差 (採用した候補の残差から推定した標準偏差に対する倍率)
+RANSAC_EVAL_POINTS = 5000   # 候補の評価に使う点数の上限 (多い場合は無作為に間引く)
+RANSAC_SEED = 0             # 再実行で結果が変わらないよう乱数は固定
+MAX_CONDITION_NUMBER = 1e10 # 正規方程式の条件数がこれ以上のスライスは解けないものとして扱う
+FIT_CACHE_SIZE = 8          # store ごとに覚えておく近似結果の数
+
+# 各フィールドは shape = (系列数, 範囲数, ...) の配列
+# params / errors の並び: 直線・多項式は [c0, c1, ...] (y = c0 + c1 x + ...)、指数・べきは [A, B]
+# r2 は当てはめた座標系での決定係数 (指数・べきは log y に対する値)
+FitResult = namedtuple("FitResult", ["model", "params", "errors", "r2", "n", "valid"])
+
+
+def range_bounds(store, ranges):
+    """各系列・各範囲 [x_min, x_max] に含まれる点のインデックス区間 [lo, hi)"""
+    ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+    offsets = store.offsets
+    n_series = len(store)
+    lo = np.empty((n_series, len(ranges)), dtype=np.int64)
+    hi = np.empty((n_series, len(ranges)), dtype=np.int64)
+    for i in range(n_series):
+        x_seg, _ = store.series(i)
+        lo[i] = offsets[i] + np.searchsorted(x_seg, ranges[:, 0], side='left')
+        hi[i] = offsets[i] + np.searchsorted(x_seg, ranges[:, 1], side='right')
+    return lo, hi
+
+
+def model_degree(model, degree=1):
+    """当てはめる多項式の次数 (多項式以外は直線)"""
+    return int(degree) if model == "poly" else 1
+
+
+def evaluate(model, params, x):
+    """パラメータ 1 組 (params[i, j]) でモデルの値を計算する"""
+    x = np.asarray(x, dtype=float)
+    if model == "exp":
+        return params[0] * np.exp(params[1] * x)
+    if model == "power":
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(x > 0, params[0] * np.abs(x) ** params[1], np.nan)
+    return np.polynomial.polynomial.polyval(x, params)
+
+
+def _batched_polyfit(u, v, w, seg, n_seg, degree):
+    """
+    全スライスの点を連結した配列から、スライスごとの重み付き多項式近似を一括で解く
+    u, v, w: 点ごとの説明変数・目的変数・重み (w > 0 の点のみ渡す)
+    seg: 点ごとのスライス番号 (0..n_seg-1、昇順に並んでいること)
+    桁落ちを抑えるため、スライスごとに u を平均 0・最大絶対値 1 に正規化してから正規方程式を解き、
+    係数と共分散を元の u の多項式に変換して返す
+    返り値: (coef (n_seg, degree+1), cov (n_seg, degree+1, degree+1), r2, n, valid)
+    """
+    n_par = degree + 1
+    n = np.bincount(seg, minlength=n_seg)
+    sw = np.bincount(seg, weights=w, minlength=n_seg)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m = np.bincount(seg, weights=w * u, minlength=n_seg) / sw
+        v_mean = np.bincount(seg, weights=w * v, minlength=n_seg) / sw
+    m = np.nan_to_num(m)
+    dev = np.abs(u - m[seg])
+    s = np.zeros(n_seg)
+    has = n > 0
+    if has.any():
+        starts = np.concatenate(([0], np.cumsum(n)[:-1]))
+        s[has] = np.maximum.reduceat(dev, starts[has])
+    valid = (n >= n_par) & (s > 0)
+    s = np.where(s > 0, s, 1.0)
+    t = (u - m[seg]) / s[seg]
+
+    # 正規方程式 A c = b (A[j, k] = Σ w t^(j+k), b[j] = Σ w t^j v)
+    powers = np.empty((t.size, 2 * degree + 1))
+    powers[:, 0] = 1.0
+    for p in range(1, 2 * degree + 1):
+        np.multiply(powers[:, p - 1], t, out=powers[:, p])
+    moments = np.stack([np.bincount(seg, weights=w * p, minlength=n_seg) for p in powers.T], axis=1)
+    rhs = np.stack([np.bincount(seg, weights=w * p * v, minlength=n_seg) for p in powers[:, :n_par].T], axis=1)
+    idx = np.arange(n_par)
+    A = moments[:, idx[:, None] + idx[None, :]]
+    # 点数が足りていても、X の異なる値が次数 + 1 個未満なら正規方程式は特異になる
+    # (t は [-1, 1] に正規化済みなので、条件数の閾値はスライスによらず固定でよい)
+    A[~valid] = np.eye(n_par)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cond = np.linalg.cond(A)
+    valid &= np.isfinite(cond) & (cond < MAX_CONDITION_NUMBER)
+    # 解けないスライスは単位行列に置き換えて一括で逆行列を求める (結果は valid=False で捨てる)
+    A[~valid] = np.eye(n_par)
+    rhs[~valid] = 0.0
+    A_inv = np.linalg.inv(A)
+    coef_t = np.einsum('kij,kj->ki', A_inv, rhs)
+
+    pred = np.einsum('ij,ij->i', powers[:, :n_par], coef_t[seg])
+    sse = np.bincount(seg, weights=w * (v - pred) ** 2, minlength=n_seg)
+    sst = np.bincount(seg, weights=w * (v - v_mean[seg]) ** 2, minlength=n_seg)
+    dof = n - n_par
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(sst > 0, 1.0 - sse / sst, 1.0)
+        # 誤差は残差から推定する (重み付きでも重みの絶対値には依存しない)
+        s2 = np.where(dof > 0, sse / dof, np.nan)
+    cov_t = A_inv * s2[:, None, None]
+
+    # t = (u - m) / s の多項式を u の多項式に戻す: c_u[j] = Σ_k c_t[k] C(k, j) (-m)^(k-j) / s^k
+    k = idx[None, :]
+    j = idx[:, None]
+    binom = np.array([[math.comb(kk, jj) for kk in range(n_par)] for jj in range(n_par)], dtype=float)
+    expo = np.clip(k - j, 0, None)
+    T = binom[None] * (-m[:, None, None]) ** expo[None] / s[:, None, None] ** k[None]
+    T = np.where((k >= j)[None], T, 0.0)
+    coef = np.einsum('kij,kj->ki', T, coef_t)
+    cov = T @ cov_t @ np.transpose(T, (0, 2, 1))
+    return coef, cov, r2, n, valid
+
+
+def _median_by_segment(values, seg, n_seg):
+    """スライスごとの中央値 (seg は昇順)。点の無いスライスは NaN"""
+    out = np.full(n_seg, np.nan)
+    counts = np.bincount(seg, minlength=n_seg)
+    ends = np.cumsum(counts)
+    for k in np.flatnonzero(counts):
+        out[k] = np.median(values[ends[k] - counts[k]:ends[k]])
+    return out
+
+
+def _robust_scale(resid, seg, n_seg):
+    """残差の標準偏差の頑健な推定 (1.4826 × MAD)"""
+    scale = 1.4826 * _median_by_segment(np.abs(resid), seg, n_seg)
+    return np.where(scale > 0, scale, np.nan)
+
+
+def _line_residuals(coef, u, v, seg):
+    return v - (coef[seg, 0] + coef[seg, 1] * u)
+
+
+def _huber_weights(coef, u, v, w, seg, n_seg):
+    """Huber の IRLS: 残差が大きい点ほど重みを下げて解き直す"""
+    h = np.ones(u.size)
+    for _ in range(HUBER_MAX_ITER):
+        resid = _line_residuals(coef, u, v, seg)
+        scale = _robust_scale(resid * np.sqrt(w), seg, n_seg)
+        limit = HUBER_K * scale[seg]
+        r_abs = np.abs(resid) * np.sqrt(w)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            h = np.where((r_abs <= limit) | ~np.isfinite(limit), 1.0, limit / r_abs)
+        new_coef = _batched_polyfit(u, v, w * h, seg, n_seg, 1)[0]
+        converged = np.allclose(new_coef, coef, rtol=HUBER_TOLERANCE, atol=0)
+        coef = new_coef
+        if converged:
+            break
+    return w * h
+
+
+def _ransac_weights(coef, u, v, w, seg, n_seg):
+    """
+    RANSAC: 無作為に選んだ 2 点を通る直線を候補とし、残差の中央値が最小の候補を採用する (LMedS)
+    その中央値から閾値を決め、閾値内のインライアだけを残す重みを返す
+    (最後に通常の重み付き最小二乗で解き直す)
+    """
+    rng = np.random.default_rng(RANSAC_SEED)
+    keep = np.ones(u.size, dtype=bool)
+    counts = np.bincount(seg, minlength=n_seg)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    for k in range(n_seg):
+        n = counts[k]
+        if n < 3:
+            continue
+        lo = starts[k]
+        us, vs = u[lo:lo + n], v[lo:lo + n]
+        i1 = rng.integers(0, n, RANSAC_TRIALS)
+        i2 = rng.integers(0, n, RANSAC_TRIALS)
+        ok = us[i1] != us[i2]
+        if not ok.any():
+            continue
+        i1, i2 = i1[ok], i2[ok]
+        slope = (vs[i2] - vs[i1]) / (us[i2] - us[i1])
+        intercept = vs[i1] - slope * us[i1]
+        sample = np.arange(n) if n <= RANSAC_EVAL_POINTS else rng.choice(n, RANSAC_EVAL_POINTS, replace=False)
+        # (候補数, 評価点数) の残差をまとめて計算する
+        resid = np.abs(vs[sample][None, :] - (slope[:, None] * us[sample][None, :] + intercept[:, None]))
+        med = np.median(resid, axis=1)
+        best = np.argmin(med)
+        threshold = RANSAC_THRESHOLD * 1.4826 * med[best]
+        if threshold > 0:
+            keep[lo:lo + n] = np.abs(vs - (slope[best] * us + intercept[best])) <= threshold
+    return w * keep
+
+
+def fit_models(store, ranges, model="linear", degree=1, weighted=False, x_factor=1.0, y_factor=1.0):
+    """
+    全系列×全範囲を指定モデルで一括近似する (スケール後の座標系)
+    weighted: store.err (Y の誤差) から重み 1/σ² を付ける (誤差が欠損・0 以下の点は使わない。
+              誤差列の無い系列は重みなし)
+    指数・べき関数は log をとって直線近似する (y ≤ 0、べきでは x ≤ 0 の点は使わない)
+    """
+    ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+    n_series, n_ranges = len(store), len(ranges)
+    deg = model_degree(model, degree)
+
+    if model == "linear" and not weighted:
+        # 重みなしの直線は累積和から O(log n) で求まる
+        res = get_engine(store).fit(ranges, x_factor, y_factor)
+        return FitResult(
+            model=model,
+            params=np.stack([res.intercept, res.slope], axis=-1),
+            errors=np.stack([res.intercept_err, res.slope_err], axis=-1),
+            r2=res.r2, n=res.n, valid=res.valid,
+        )
+
+    # 全ての (系列, 範囲) の点を 1 本の配列に並べる (スライス番号 = 系列 × 範囲数 + 範囲)
+    lo, hi = range_bounds(store, ranges / x_factor)
+    lengths = np.maximum(hi - lo, 0).ravel()
+    seg = np.repeat(np.arange(lengths.size), lengths)
+    idx = np.repeat(lo.ravel() - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) + np.arange(lengths.sum())
+    x = store.x[idx] * x_factor
+    y = store.y[idx] * y_factor
+
+    w = np.ones(x.size)
+    if weighted and store.err is not None:
+        sigma = np.abs(store.err[idx] * y_factor)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w_err = np.where(sigma > 0, 1.0 / sigma ** 2, 0.0)
+        w_err[~np.isfinite(w_err)] = 0.0
+        # 誤差列を指定していない系列 (誤差が全て欠損) は重みなしで近似する
+        has_err = np.logical_or.reduceat(np.isfinite(store.err), store.offsets[:-1]) if n_series else np.zeros(0, bool)
+        w = np.where(has_err[seg // max(n_ranges, 1)], w_err, 1.0)
+
+    u, v = x, y
+    if model in ("exp", "power"):
+        positive = y > 0
+        if model == "power":
+            positive &= x > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v = np.log(np.where(positive, y, 1.0))
+            u = np.log(np.where(positive, x, 1.0)) if model == "power" else x
+            # log y の誤差は σ / y なので重みは (y / σ)² になる
+            if weighted and store.err is not None:
+                w = w * y ** 2
+        w = np.where(positive, w, 0.0)
+
+    use = w > 0
+    u, v, w, seg = u[use], v[use], w[use], seg[use]
+    n_seg = lengths.size
+
+    coef, cov, r2, n, valid = _batched_polyfit(u, v, w, seg, n_seg, deg)
+    if model in ("huber", "ransac"):
+        robust = _huber_weights if model == "huber" else _ransac_weights
+        w = robust(coef, u, v, w, seg, n_seg)
+        use = w > 0
+        coef, cov, r2, n, valid = _batched_polyfit(u[use], v[use], w[use], seg[use], n_seg, deg)
+
+    errors = np.sqrt(np.clip(np.diagonal(cov, axis1=1, axis2=2), 0, None))
+    params = coef
+    if model in ("exp", "power"):
+        # ln A = c0 → A = exp(c0)、σ_A = A σ_c0
+        amplitude = np.exp(coef[:, 0])
+        params = np.stack([amplitude, coef[:, 1]], axis=-1)
+        errors = np.stack([amplitude * errors[:, 0], errors[:, 1]], axis=-1)
+
+    shape = (n_series, n_ranges)
+    valid = valid & np.isfinite(params).all(axis=1)
+    return FitResult(
+        model=model,
+        params=np.where(valid[:, None], params, np.nan).reshape(shape + (-1,)),
+        errors=np.where(valid[:, None], errors, np.nan).reshape(shape + (-1,)),
+        r2=np.where(valid, r2, np.nan).reshape(shape),
+        n=n.reshape(shape),
+        valid=valid.reshape(shape),
+    )
+
+
+def get_fits(store, ranges, model="linear", degree=1, weighted=False, x_factor=1.0, y_factor=1.0):
+    """
+    fit_models の結果を store ごとに覚えておく (同じ設定での再実行では計算しない)
+    直近 FIT_CACHE_SIZE 件だけ保持する
+    store はセッション間で共有されるので、キャッシュの操作はロックを取って行う (計算自体はロックの外)
+    """
+    # dict.setdefault は不可分なので、全スレッドが同じキャッシュとロックを得る
+    cache = store.derived.setdefault("model_fits", OrderedDict())
+    lock = store.derived.setdefault("model_fits_lock", threading.Lock())
+    ranges_key = tuple(map(tuple, np.asarray(ranges, dtype=float).reshape(-1, 2).tolist()))
+    key = (model, model_degree(model, degree), bool(weighted), ranges_key, float(x_factor), float(y_factor))
+    with lock:
+        result = cache.get(key)
+        if result is not None:
+            cache.move_to_end(key)
+            return result
+
+    result = fit_models(store, ranges, model, degree, weighted, x_factor, y_factor)
+    with lock:
+        cache[key] = result
+        cache.move_to_end(key)
+        while len(cache) > FIT_CACHE_SIZE:
+            cache.popitem(last=False)
+    return result
@@ -0,0 +1,251 @@
+# latex_table.py
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# MergeIndex の変更ごとに振る通し番号 (インスタンスをまたいで一意)
+_merge_versions = itertools.count(1)
+
+
+class TableBuffer:
+    """
+    編集用の表を、余裕を持って確保した object 配列で保持するバッファ
+    - 行・列の容量は不足したときだけ倍々で拡張する (償却 O(1))
+    - 論理サイズの外側のセルは常に "" に保つので、拡大は O(追加分) で済む
+    - frame() はバッファの先頭部分をコピーせずに DataFrame として返す
+    """
+
+    def __init__(self, df):
+        rows, cols = df.shape
+        self._data = np.full((max(rows, 1), max(cols, 1)), "", dtype=object)
+        self._data[:rows, :cols] = df.to_numpy(dtype=object)
+        self._columns = list(df.columns)
+        self._column_set = set(self._columns)
+        self.rows, self.cols = rows, cols
+        self._frame = None
+
+    @property
+    def capacity(self):
+        return self._data.shape
+
+    def _reserve(self, rows, cols):
+        cap_rows, cap_cols = self._data.shape
+        if rows <= cap_rows and cols <= cap_cols:
+            return
+        new_rows = max(rows, cap_rows * 2) if rows > cap_rows else cap_rows
+        new_cols = max(cols, cap_cols * 2) if cols > cap_cols else cap_cols
+        data = np.full((new_rows, new_cols), "", dtype=object)
+        data[:self.rows, :self.cols] = self._data[:self.rows, :self.cols]
+        self._data = data
+
+    def sync(self, df):
+        """外部で編集された表 (同じ形) の内容と列名をバッファに取り込む"""
+        if df.shape != (self.rows, self.cols):
+            raise ValueError("表の形がバッファと一致しません。")
+        if df is not self._frame:
+            self._data[:self.rows, :self.cols] = df.to_numpy(dtype=object)
+            self._frame = None
+        # 列名の変更はフレームを差し替えずに行われることがある
+        if list(df.columns) != self._columns:
+            self._columns = list(df.columns)
+            self._column_set = set(self._columns)
+            self._frame = None
+
+    def _new_column_name(self):
+        new_col = f"列 {len(self._columns) + 1}"
+        base = new_col
+        n = 1
+        while new_col in self._column_set:
+            new_col = f"{base}_{n}"
+            n += 1
+        return new_col
+
+    def resize(self, rows, cols):
+        if (rows, cols) == (self.rows, self.cols):
+            return
+        self._reserve(rows, cols)
+
+        # 縮小した部分は空に戻しておく (次の拡大でそのまま使える)
+        if rows < self.rows:
+            self._data[rows:self.rows, :self.cols] = ""
+        if cols < self.cols:
+            self._data[:, cols:self.cols] = ""
+            for name in self._columns[cols:]:
+                self._column_set.discard(name)
+            del self._columns[cols:]
+        for _ in range(cols - self.cols):
+            name = self._new_column_name()
+            self._columns.append(name)
+            self._column_set.add(name)
+
+        self.rows, self.cols = rows, cols
+        self._frame = None
+
+    def frame(self):
+        """現在の論理サイズ分の DataFrame (バッファと同じメモリを参照)"""
+        if self._frame is None:
+            self._frame = pd.DataFrame(
+                self._data[:self.rows, :self.cols], columns=list(self._columns), dtype=object, copy=False
+            )
+        return self._frame
+
+
+class MergeIndex:
+    """
+    セル結合の一覧と、セル -> 結合 の逆引き (グリッド索引) を保持する
+    - owner / is_covered / is_anchor はセル 1 つあたり O(1)
+    - 既存の結合と重なる結合は追加時に ValueError で拒否する
+    - 一覧としても使えるよう、反復・len・添字アクセス・pop に対応
+    - version は内容が変わるたびに更新される (描画キャッシュの無効化用)
+    """
+
+    def __init__(self, merges=()):
+        self._merges = []
+        self._owner = {}
+        self.version = next(_merge_versions)
+        for m in merges:
+            self.add(m)
+
+    @staticmethod
+    def _cells(m):
+        for i in range(m["r"], m["r"] + m["rs"]):
+            for j in range(m["c"], m["c"] + m["cs"]):
+                yield i, j
+
+    def find_overlap(self, m):
+        """m と重なる既存の結合 (無ければ None)"""
+        for cell in self._cells(m):
+            owner = self._owner.get(cell)
+            if owner is not None:
+                return owner
+        return None
+
+    def add(self, m):
+        if m["r"] < 0 or m["c"] < 0 or m["rs"] < 1 or m["cs"] < 1:
+            raise ValueError("結合範囲の指定が不正です。")
+        other = self.find_overlap(m)
+        if other is not None:
+            raise ValueError(
+                f"既存の結合 (行{other['r']+1}, 列{other['c']+1}, {other['rs']}×{other['cs']}) と重なっています。"
+            )
+        m = dict(m)
+        self._merges.append(m)
+        for cell in self._cells(m):
+            self._owner[cell] = m
+        self.version = next(_merge_versions)
+
+    def pop(self, i):
+        m = self._merges.pop(i)
+        for cell in self._cells(m):
+            del self._owner[cell]
+        self.version = next(_merge_versions)
+        return m
+
+    def owner(self, i, j):
+        """セル (i, j) を含む結合 (無ければ None)"""
+        return self._owner.get((i, j))
+
+    def is_covered(self, i, j):
+        return (i, j) in self._owner
+
+    def is_anchor(self, i, j):
+        m = self._owner.get((i, j))
+        return m is not None and m["r"] == i and m["c"] == j
+
+    def clip(self, rows, cols):
+        """rows × cols の表に収まる結合だけを残した新しい索引"""
+        return MergeIndex(
+            m for m in self._merges
+            if m["r"] + m["rs"] <= rows and m["c"] + m["cs"] <= cols
+        )
+
+    def covered_mask(self, shape):
+        """結合に含まれるセルの bool マスク"""
+        mask = np.zeros(shape, dtype=bool)
+        for m in self._merges:
+            mask[m["r"]:m["r"] + m["rs"], m["c"]:m["c"] + m["cs"]] = True
+        return mask
+
+    def skip_mask(self, shape):
+        """出力を省略するセル (結合に含まれ、起点ではないセル) の bool マスク"""
+        rows, cols = shape
+        for m in self._merges:
+            if m["r"] + m["rs"] > rows or m["c"] + m["cs"] > cols:
+                raise IndexError(f"結合範囲 (行{m['r']+1}, 列{m['c']+1}, {m['rs']}×{m['cs']}) が表の範囲外です。")
+        mask = self.covered_mask(shape)
+        for m in self._merges:
+            mask[m["r"], m["c"]] = False
+        return mask
+
+    def __iter__(self):
+        return iter(self._merges)
+
+    def __len__(self):
+        return len(self._merges)
+
+    def __getitem__(self, i):
+        return self._merges[i]
+
+
+def _merge_cell(text, rs, cs):
+    """結合セルの LaTeX 表記"""
+    if rs > 1 and cs > 1:
+        return "\\multicolumn{" + str(cs) + "}{c}{\\multirow{" + str(rs) + "}{*}{" + text + "}}"
+    elif rs > 1:
+        return "\\multirow{" + str(rs) + "}{*}{" + text + "}"
+    elif cs > 1:
+        return "\\multicolumn{" + str(cs) + "}{c}{" + text + "}"
+    return text
+
+
+def generate_custom_latex(df, merges, caption, label, col_fmt, use_booktabs, center):
+    """
+    DataFrame と結合 (MergeIndex または dict のリスト) から tabular 環境の LaTeX コードを生成する
+    セルの文字列化は表全体で 1 回だけ行い、行の連結は行単位の join で済ませる
+    """
+    rows, cols = df.shape
+
+    if not isinstance(merges, MergeIndex):
+        merges = MergeIndex(merges)
+    skip = merges.skip_mask((rows, cols))
+
+    # 全セルを一括で文字列化 (str(セル値) と同じ結果)
+    cells = df.to_numpy(dtype=object).astype(str).astype(object)
+    for m in merges:
+        r, c = m["r"], m["c"]
+        cells[r, c] = _merge_cell(str(df.iat[r, c]), m["rs"], m["cs"])
+
+    top = "\\toprule" if use_booktabs else "\\hline"
+    mid = "\\midrule" if use_booktabs else "\\hline"
+    bottom = "\\bottomrule" if use_booktabs else "\\hline"
+
+    lines = []
+    lines.append("\\begin{table}[htbp]")
+    if center:
+        lines.append("  \\centering")
+
+    if caption:
+        lines.append(f"  \\caption{{{caption}}}")
+    if label:
+        lines.append(f"  \\label{{{label}}}")
+
+    lines.append(f"  \\begin{{tabular}}{{{col_fmt}}}")
+    lines.append(f"    {top}")
+
+    # header
+    header = " & ".join([f"\\textbf{{{c}}}" for c in df.columns]) + " \\\\"
+    lines.append("    " + header)
+    lines.append(f"    {mid}")
+
+    # body: 省略セルの無い行はそのまま、ある行だけマスクで間引いて連結
+    row_texts = [" & ".join(row) for row in cells.tolist()]
+    for i in np.flatnonzero(skip.any(axis=1)):
+        row_texts[i] = " & ".join(cells[i, ~skip[i]].tolist())
+    lines.extend("    " + text + " \\\\" for text in row_texts)
+
+    lines.append(f"    {bottom}")
+    lines.append("  \\end{tabular}")
+    lines.append("\\end{table}")
+
+    return "\n".join(lines)
@@ -1,61 +1,24 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-import math
 import numpy as np
-import io
 import sys
 import os
-import japanize_matplotlib
 
 # 親ディレクトリへのパス追加 (auth_manager, style読み込み用)
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import style
 import auth_manager
-
-# ---------------------------------------------------------
-# ユーティリティ関数
-# ---------------------------------------------------------
-def get_auto_scale_info(max_val):
-    if max_val == 0 or pd.isna(max_val):
-        return 1.0, "", 0
-    exponent = math.floor(math.log10(max_val) / 3) * 3
-    if exponent == 0:
-        return 1.0, "", 0
-    si_prefixes = {
-        -12: 'p', -9: 'n', -6: r'$\mu$', -3: 'm', 
-        0: '', 3: 'k', 6: 'M', 9: 'G', 12: 'T'
-    }
-    scale_factor = 10 ** (-exponent)
-    prefix = si_prefixes.get(exponent, "")
-    return scale_factor, prefix, exponent
-
-def scientific_formatter(x, pos):
-    """軸目盛り用のフォーマッター"""
-    if x == 0:
-        return "0"
-    exponent = int(math.floor(math.log10(abs(x))))
-    mantissa = x / (10 ** exponent)
-    return f"${mantissa:.2f} \\times 10^{{{exponent}}}$"
-
-def to_latex_sci(x):
-    """
-    数値をLaTeX形式の文字列に変換する関数
-    - 指数が -1, 0, 1 の場合は通常の小数表記にする
-    - それ以外は a \times 10^b の形式にする
-    """
-    if x == 0:
-        return "0"
-    
-    exponent = int(math.floor(math.log10(abs(x))))
-    
-    if exponent in [-1, 0, 1]:
-        return f"{x:.3g}"
-
-    mantissa = x / (10 ** exponent)
-    return f"{mantissa:.2f} \\times 10^{{{exponent}}}"
-
+import plot_setup
+import data_loader
+from series_store import SeriesStore
+import render_cache
+import downsample
+import scatter_plot
+import fitting
+
+# グラフの並べ方
+LAYOUT_OVERLAY = "1 つのグラフに重ねる"
+LAYOUT_BY_SERIES = "系列ごとに並べる"
+LAYOUT_BY_SHEET = "シートごとに並べる"
 # ---------------------------------------------------------
 # メインアプリ
 # ---------------------------------------------------------
@@ -69,30 +32,64 @@ def main():
     # 1. サイドバー（データ読み込み）
     # ==========================================
     st.sidebar.header("データ読み込み")
-    uploaded_file = st.sidebar.file_uploader("ファイルを選択", type=["csv", "xlsx"])
+    uploaded_file = st.sidebar.file_uploader("ファイルを選択", type=["csv", "xlsx", "parquet", "feather", "npy", "npz"])
 
     df = None
+    selected_sheet = None
+    sheet_names = []
+    stream_csv = False
     if uploaded_file is not None:
         try:
-            if uploaded_file.name.endswith('.xlsx'):
-                xl = pd.ExcelFile(uploaded_file)
-                sheet_names = xl.sheet_names
+            # 解析結果は内容ハッシュ+シート名でキャッシュ (再実行時は辞書参照のみ)
+            ext = data_loader.file_extension(uploaded_file.name)
+            if ext == '.xlsx':
+                sheet_names = data_loader.get_sheet_names(uploaded_file)
                 st.sidebar.subheader("シート選択")
                 if len(sheet_names) > 1:
                     selected_sheet = st.sidebar.selectbox("対象のシート", sheet_names)
                 else:
                     selected_sheet = sheet_names[0]
-                df = pd.read_excel(uploaded_file, sheet_name=selected_sheet)
+                df = data_loader.read_table(uploaded_file, sheet_name=selected_sheet)
+            elif ext == '.csv' and uploaded_file.size > data_loader.CSV_STREAM_THRESHOLD_BYTES:
+                # 大きな CSV は先頭だけ読み、選択された列のみ後から分割読み込みする
+                stream_csv = True
+                df = data_loader.read_csv_sample(uploaded_file)
+                st.sidebar.caption(f"大きなファイルのため、列選択には先頭 {len(df):,} 行のみ表示します。")
+                use_float32 = st.sidebar.checkbox("float32 で読み込む (省メモリ)", value=False)
             else:
-                df = pd.read_csv(uploaded_file)
+                df = data_loader.read_table(uploaded_file)
         except Exception as e:
             st.sidebar.error(f"読み込みエラー: {e}")
 
+    # --- 表示レイアウト (複数のグラフを格子状に並べる) ---
+    layout_mode = LAYOUT_OVERLAY
+    grid_sheets = []
+    if df is not None:
+        st.sidebar.subheader("表示レイアウト")
+        layout_options = [LAYOUT_OVERLAY, LAYOUT_BY_SERIES]
+        if len(sheet_names) > 1:
+            layout_options.append(LAYOUT_BY_SHEET)
+        layout_mode = st.sidebar.radio(
+            "グラフの並べ方", layout_options,
+            help="並べる場合も、読み込み・スケール計算・近似計算は全パネルで 1 回だけ行います。"
+        )
+        if layout_mode == LAYOUT_BY_SHEET:
+            grid_sheets = st.sidebar.multiselect(
+                "並べるシート", sheet_names, default=sheet_names,
+                help="表示中のシートで選んだ列と同じ名前の列を各シートから取り出します。"
+            )
+        if layout_mode != LAYOUT_OVERLAY:
+            grid_ncols = st.sidebar.number_input("横に並べる数", min_value=1, max_value=6, value=scatter_plot.GRID_DEFAULT_COLUMNS)
+            grid_share_axes = st.sidebar.checkbox("軸の範囲をそろえる", value=True)
+
         
     # --- 認証 & アナリティクス ---
     auth_manager.check_auth()
     # -------------------------
 
+    # フォントの準備を裏で始めておく (描画時に待たされないように)
+    plot_setup.warm_up_in_background()
+
     # ==========================================
     # メインエリア
     # ==========================================
@@ -118,40 +115,72 @@ def main():
         return
 
     # --- データ抽出処理 ---
-    series_list = [] 
-    all_x_values = []
-    all_y_values = []
+    # 全系列を連続した float 配列 + オフセットで保持する
+    col_pairs = [(selected_cols[i], selected_cols[i+1]) for i in range(0, len(selected_cols), 2)]
+
+    # 重み付き近似に使う Y の誤差列 (任意)
+    err_cols = []
+    with st.expander("誤差列の指定 (重み付き近似用・任意)"):
+        for i, (col_x, col_y) in enumerate(col_pairs):
+            err_cols.append(st.selectbox(
+                f"{col_y} の誤差 (1σ)", [None] + list(df.columns),
+                format_func=lambda c: "なし" if c is None else str(c), key=f"err_col_{i}"
+            ))
+    if not any(c is not None for c in err_cols):
+        err_cols = None
+    # 同じファイル・シート・列の組み合わせなら構築済みのストアを再利用する
+    store_key = (data_loader.upload_digest(uploaded_file), selected_sheet, tuple(col_pairs), "series")
+    if layout_mode == LAYOUT_BY_SHEET:
+        if not grid_sheets:
+            st.info("サイドバーで並べるシートを選択")
+            return
+        # 選んだシートの同じ列ペアを 1 つのストアにまとめる (系列名は "シート名: 列名")
+        store_key = (data_loader.upload_digest(uploaded_file), tuple(grid_sheets), tuple(col_pairs), "series")
+        if err_cols:
+            store_key += (tuple(err_cols),)
+
+        def build_store():
+            frames = {name: data_loader.read_table(uploaded_file, sheet_name=name) for name in grid_sheets}
+            return SeriesStore.from_frames(frames, col_pairs, err_cols=err_cols)
+
+        store = data_loader.get_series_store(store_key, build_store)
+    elif stream_csv:
+        dtype = np.float32 if use_float32 else np.float64
+        store_key += (np.dtype(dtype).str,)
+        if err_cols:
+            store_key += (tuple(err_cols),)
+
+        def build_store():
+            read_cols = list(dict.fromkeys(list(selected_cols) + [c for c in err_cols or [] if c is not None]))
+            columns = data_loader.read_csv_columns(uploaded_file, read_cols, dtype=dtype)
+            return SeriesStore.from_columns(columns, col_pairs, dtype=dtype, err_cols=err_cols)
 
-    for i in range(0, len(selected_cols), 2):
-        col_x = selected_cols[i]
-        col_y = selected_cols[i+1]
-        
-        clean_x = pd.to_numeric(df[col_x], errors='coerce')
-        clean_y = pd.to_numeric(df[col_y], errors='coerce')
-        pair_df = pd.DataFrame({'X': clean_x, 'Y': clean_y}).dropna()
-        pair_df = pair_df.sort_values(by='X')
-
-        if not pair_df.empty:
-            series_list.append({
-                "x": pair_df['X'],
-                "y": pair_df['Y'],
-                "col_x_name": col_x, 
-                "col_y_name": col_y, 
-                "label_name": col_x  
-            })
-            all_x_values.extend(pair_df['X'].abs().tolist())
-            all_y_values.extend(pair_df['Y'].abs().tolist())
-
-    if not series_list:
+        try:
+            with st.spinner("選択列を読み込み中..."):
+                store = data_loader.get_series_store(store_key, build_store)
+        except Exception as e:
+            st.error(f"読み込みエラー: {e}")
+            return
+    else:
+        if err_cols:
+            store_key += (tuple(err_cols),)
+        store = data_loader.get_series_store(store_key, lambda: SeriesStore.from_frame(df, col_pairs, err_cols=err_cols))
+
+    if store.empty:
         st.error("有効なデータがありません。")
         return
 
+    series_list = scatter_plot.series_from_store(store)
+    # 軸ラベルの初期値は最初の系列の列名 (シートごとに並べる場合はシート名を除く)
+    default_x_label, default_y_label = col_pairs[0] if layout_mode == LAYOUT_BY_SHEET else (
+        series_list[0]['col_x_name'], series_list[0]['col_y_name'])
+
     # --- グラフ設定 ---
     st.divider()
     st.markdown("##### 2. グラフ設定")
 
-    global_max_x = max(all_x_values) if all_x_values else 0
-    global_max_y = max(all_y_values) if all_y_values else 0
+    global_max_x = store.abs_max_x()
+    global_max_y = store.abs_max_y()
     
     col_ui1, col_ui2 = st.columns(2)
     
@@ -161,10 +190,10 @@ def main():
         auto_scale_x = st.checkbox("自動スケーリング (X)", value=False)
         x_scale_factor, x_prefix = 1.0, ""
         if auto_scale_x:
-            x_scale_factor, x_prefix, x_exp = get_auto_scale_info(global_max_x)
+            x_scale_factor, x_prefix, x_exp = scatter_plot.get_auto_scale_info(global_max_x)
             if x_scale_factor != 1.0:
                 st.info(f"💡 スケール: **{x_prefix}** ($10^{{{x_exp}}}$)")
-        x_label = st.text_input("X軸ラベル (TeX形式は$で囲む)", value=series_list[0]['col_x_name'])
+        x_label = st.text_input("X軸ラベル (TeX形式は$で囲む)", value=default_x_label)
 
 
     # Y軸設定
@@ -173,41 +202,59 @@ def main():
         auto_scale_y = st.checkbox("自動スケーリング (Y)", value=True)
         y_scale_factor, y_prefix = 1.0, ""
         if auto_scale_y:
-            y_scale_factor, y_prefix, y_exp = get_auto_scale_info(global_max_y)
+            y_scale_factor, y_prefix, y_exp = scatter_plot.get_auto_scale_info(global_max_y)
             if y_scale_factor != 1.0:
                 st.info(f"💡 スケール: **{y_prefix}** ($10^{{{y_exp}}}$)")
-        y_label = st.text_input("Y軸ラベル (TeX形式は$で囲む)", value=series_list[0]['col_y_name'])
+        y_label = st.text_input("Y軸ラベル (TeX形式は$で囲む)", value=default_y_label)
+
+    # 点数が多い場合はプレビューのみ間引いて描画する (近似は常に全データで計算)
+    use_downsample = False
+    if store.x.size > downsample.PREVIEW_POINT_BUDGET:
+        use_downsample = st.checkbox(
+            "大規模データを間引いて表示 (プレビューのみ)", value=True,
+            help=f"全 {store.x.size:,} 点を、表示上の外形を保ったまま約 {downsample.PREVIEW_POINT_BUDGET:,} 点に間引きます。"
+        )
 
     # ==========================================
-    # 3. 近似直線設定（多重対応）
+    # 3. 近似設定（多重対応）
     # ==========================================
     st.divider()
-    st.markdown("##### 3. 近似直線の設定")
+    st.markdown("##### 3. 近似の設定")
 
     col_fit_setting, col_fit_sliders = st.columns([1, 2])
     
     fit_configs = [] 
+    fit_model, fit_degree, fit_weighted, show_errors = "linear", 1, False, False
 
     with col_fit_setting:
-        enable_fitting = st.checkbox("近似直線を追加する", value=False)
+        enable_fitting = st.checkbox("近似線を追加する", value=False)
         
         if enable_fitting:
-            num_fits = st.number_input("直線の本数", min_value=1, max_value=5, value=1)
+            fit_model = st.selectbox(
+                "近似モデル", list(fitting.FIT_MODELS), format_func=fitting.FIT_MODELS.get,
+                help="ロバスト近似は外れ値の影響を抑えます。指数・べき関数は log をとって直線近似します (y ≤ 0 の点は除外)。"
+            )
+            if fit_model == "poly":
+                fit_degree = st.number_input("次数", min_value=2, max_value=fitting.MAX_POLY_DEGREE, value=2)
+            if store.err is not None:
+                fit_weighted = st.checkbox("誤差列で重み付けする (1/σ²)", value=True)
+            show_errors = st.checkbox("凡例に不確かさ (±1σ) を表示", value=False)
+            num_fits = st.number_input("近似線の本数", min_value=1, max_value=10, value=1)
             extend_full = st.checkbox("線をグラフ全体に延長", value=True, help="OFFにすると、選択範囲の少し外側までしか線を描画しません。")
     
     if enable_fitting:
-        all_scaled_x = []
-        for s in series_list:
-             all_scaled_x.extend((s['x'] * (x_scale_factor if auto_scale_x else 1.0)).tolist())
-        
-        if all_scaled_x:
-            min_val = float(min(all_scaled_x))
-            max_val = float(max(all_scaled_x))
+        # スケール係数は正なので、スケール後の範囲は元の範囲を掛けるだけで求まる
+        x_min_raw, x_max_raw = store.x_range()
+        x_factor = x_scale_factor if auto_scale_x else 1.0
+
+        if not store.empty:
+            min_val = x_min_raw * x_factor
+            max_val = x_max_raw * x_factor
             margin_val = (max_val - min_val) * 0.05 if max_val != min_val else 1.0
             
             with col_fit_sliders:
                 for i in range(num_fits):
-                    st.markdown(f"**近似直線 {i+1} の範囲**")
+                    st.markdown(f"**近似 {i+1} の範囲**")
                     f_range = st.slider(
                         f"Fit {i+1} 範囲指定",
                         min_value=min_val - margin_val,
@@ -233,140 +280,101 @@ def main():
     # プロット描画処理
     # ==========================================
     st.divider()
-    fig, ax = plt.subplots(figsize=(6, 4))
-    
-    # --- 副目盛りを有効化 ---
-    ax.minorticks_on() 
-    # ---------------------
 
-    ax.tick_params(direction="in", top=True, right=True, which="both")
-    
-    colors = ['black', 'blue', 'red', 'orange', 'green', 'purple', 'brown']
-    markers = ['o', 's', '^', 'D', 'v', '<', '>']
-    linestyles = ['--', '-.', ':', '--', '-.']
+    # グリッド表示: 系列 (またはシート) ごとのパネルに分ける
+    layout = None
+    if layout_mode == LAYOUT_BY_SERIES:
+        layout = scatter_plot.make_grid_layout(series_list, grid_ncols, grid_share_axes)
+    elif layout_mode == LAYOUT_BY_SHEET:
+        layout = scatter_plot.make_grid_layout(series_list, grid_ncols, grid_share_axes, groups=grid_sheets)
+
+    # 描画設定 (キャッシュキーにもなるため、描画結果に影響する値をすべて含める)
+    plot_spec = scatter_plot.make_plot_spec(
+        store, series_list,
+        auto_scale_x=auto_scale_x,
+        auto_scale_y=auto_scale_y,
+        x_label=x_label,
+        y_label=y_label,
+        fit_ranges=fit_configs if enable_fitting else (),
+        extend_full=enable_fitting and extend_full,
+        layout=layout,
+        fit_model=fit_model,
+        fit_degree=fit_degree,
+        fit_weighted=fit_weighted,
+        show_errors=show_errors,
+    )
 
-    plot_x_min_all = []
-    plot_x_max_all = []
-    
-    # --- Y軸範囲固定のためのデータ収集用リスト ---
-    plot_y_min_all = []
-    plot_y_max_all = []
-    # ----------------------------------------
-    
-    is_fit_plotted = False
+    # 全系列×全範囲の近似を一括計算 (重みなしの直線は累積和から範囲 1 つあたり O(log n))
+    # グリッド表示でも全パネル分をこの 1 回で求める
+    fits = scatter_plot.compute_fits(store, plot_spec)
 
-    for idx, s in enumerate(series_list):
-        x_plot = s['x'] * (x_scale_factor if auto_scale_x else 1.0)
-        y_plot = s['y'] * (y_scale_factor if auto_scale_y else 1.0)
-        
-        plot_x_min_all.append(x_plot.min())
-        plot_x_max_all.append(x_plot.max())
-        
-        # --- データ点のみの最小・最大を記録 ---
-        plot_y_min_all.append(y_plot.min())
-        plot_y_max_all.append(y_plot.max())
-        # ----------------------------------
-        
-        base_color = colors[idx % len(colors)]
-        marker = markers[idx % len(markers)]
+    def build_figure():
+        return scatter_plot.draw_plot(series_list, plot_spec, fits)
 
-        # 生データのプロット
-        ax.plot(x_plot, y_plot, label=s['label_name'], color=base_color, 
-                marker=marker, linestyle='-', linewidth=0, markersize=4, alpha=1)
+    # プレビュー用: 間引いた点で描画
+    preview_spec = plot_spec
+    preview_list = series_list
+    build_preview = build_figure
+    if use_downsample:
+        preview_list = [
+            dict(s, x=px, y=py)
+            for s, (px, py) in zip(series_list, downsample.preview_series(store))
+        ]
+        preview_spec = dict(plot_spec, points=("preview", downsample.PREVIEW_POINT_BUDGET))
 
-        # 近似直線のプロット
-        if enable_fitting:
-            for fit_idx, (f_min, f_max) in enumerate(fit_configs):
-                mask = (x_plot >= f_min) & (x_plot <= f_max)
-                x_fit = x_plot[mask]
-                y_fit = y_plot[mask]
-
-                if len(x_fit) > 1:
-                    try:
-                        coeffs = np.polyfit(x_fit, y_fit, 1)
-                        poly_func = np.poly1d(coeffs)
-                        
-                        if extend_full:
-                            x_line_min = x_plot.min()
-                            x_line_max = x_plot.max()
-                            padding = (x_line_max - x_line_min) * 0.1
-                            x_line = np.linspace(x_line_min - padding, x_line_max + padding, 100)
-                        else:
-                            padding = (f_max - f_min) * 0.2
-                            x_line = np.linspace(f_min - padding, f_max + padding, 100)
-
-                        y_line = poly_func(x_line)
-                        
-                        # 数値を変換
-                        slope = coeffs[0]
-                        intercept = coeffs[1]
-                        
-                        slope_latex = to_latex_sci(slope)
-                        intercept_latex = to_latex_sci(abs(intercept))
-                        sign = "+" if intercept >= 0 else "-"
-                        
-                        fit_label = f"Fit{fit_idx+1}: $y = {slope_latex}x {sign} {intercept_latex}$"
-                        
-                        ls = linestyles[fit_idx % len(linestyles)]
-                        
-                        ax.plot(x_line, y_line, color=base_color, linestyle=ls, 
-                                linewidth=1.5, label=fit_label, alpha=0.9)
-                        
-                        is_fit_plotted = True
-
-                    except Exception as e:
-                        pass
-
-    # 軸フォーマット設定
-    if not auto_scale_x:
-        if global_max_x > 1000 or (global_max_x < 0.001 and global_max_x > 0):
-            ax.xaxis.set_major_formatter(ticker.FuncFormatter(scientific_formatter))
-    if not auto_scale_y:
-        if global_max_y > 1000 or (global_max_y < 0.001 and global_max_y > 0):
-            ax.yaxis.set_major_formatter(ticker.FuncFormatter(scientific_formatter))
-
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
-    
-    # X軸範囲設定
-    if plot_x_min_all and plot_x_max_all:
-        x_all_min = min(plot_x_min_all)
-        x_all_max = max(plot_x_max_all)
-        margin_x = (x_all_max - x_all_min) * 0.05 if x_all_max != x_all_min else 1.0
-        ax.set_xlim(x_all_min - margin_x, x_all_max + margin_x)
-
-    # --- Y軸範囲設定（データ点に合わせて固定） ---
-    if plot_y_min_all and plot_y_max_all:
-        y_all_min = min(plot_y_min_all)
-        y_all_max = max(plot_y_max_all)
-        diff = y_all_max - y_all_min
-        # マージンを10%程度とる
-        margin_y = diff * 0.1 if diff != 0 else (abs(y_all_max) * 0.1 if y_all_max != 0 else 1.0)
-        ax.set_ylim(y_all_min - margin_y, y_all_max + margin_y)
-    # ---------------------------------------
-
-    # 凡例表示ロジック
-    if len(series_list) > 1 or is_fit_plotted:
-        ax.legend(bbox_to_anchor=(1, 1), loc='upper right', borderaxespad=0, fontsize=6)
+        def build_preview():
+            return scatter_plot.draw_plot(preview_list, preview_spec, fits)
+
+    # プレビューは描画設定が同じならキャッシュ済みの PNG を再利用
+    preview_png = render_cache.preview_png(preview_spec, build_preview)
 
     _, col_center, _ = st.columns([1, 5, 1]) 
     with col_center:
-        st.pyplot(fig, use_container_width=False)
+        st.image(preview_png, use_container_width=False)
 
     # 画像保存
     st.divider()
     col_save_input, col_save_btn = st.columns([3, 1])
     with col_save_input:
         file_name_input = st.text_input("保存ファイル名", value="multi_fit_plot")
+        export_full = True
+        if use_downsample:
+            export_full = st.checkbox("保存画像は全データで描画", value=True)
+        export_formats = ["png", "pdf", "svg"]
+        if plot_setup.pgf_available():
+            export_formats.append("pgf")
+        export_format = st.selectbox(
+            "保存形式", export_formats, format_func=str.upper,
+            help="PDF / SVG / PGF はベクター形式です。PGF は LaTeX 文書から \\input で読み込めます。"
+        )
+        if "pgf" not in export_formats:
+            st.caption("PGF で保存するには xelatex が必要です。")
+        # 点の多いデータはベクター形式でもデータ点の層だけを画像にして、ファイルを小さく保つ
+        rasterize_points = False
+        if export_format != "png" and store.x.size >= scatter_plot.RASTERIZE_POINT_THRESHOLD:
+            rasterize_points = st.checkbox(
+                "データ点をラスタ化する (軸・文字・近似直線はベクターのまま)", value=True,
+                help=f"{scatter_plot.RASTERIZE_POINT_THRESHOLD:,} 点以上のデータで有効です。ファイルサイズと保存時間を大きく減らせます。"
+            )
+    export_spec, export_list = (plot_spec, series_list) if export_full else (preview_spec, preview_list)
+
+    def build_export():
+        return scatter_plot.draw_plot(export_list, export_spec, fits, rasterize_points)
+
+    # PGF でラスタ化した層は別の PNG になるので、.pgf と画像を zip にまとめて渡す
+    if export_format == "pgf" and rasterize_points:
+        export_name, export_mime = f"{file_name_input}.zip", "application/zip"
+    else:
+        export_name, export_mime = f"{file_name_input}.{export_format}", render_cache.EXPORT_FORMATS[export_format]
     with col_save_btn:
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png", dpi=300, bbox_inches='tight')
-        buf.seek(0)
+        # 保存用のファイルはダウンロードが押されたときにだけ生成する
         st.download_button(
-            label="画像を保存 (PNG)",
-            data=buf,
-            file_name=f"{file_name_input}.png",
-            mime="image/png",
+            label=f"画像を保存 ({export_format.upper()})",
+            data=lambda: render_cache.export_file(
+                export_spec, build_export, export_format, rasterize_points, file_name_input
+            ),
+            file_name=export_name,
+            mime=export_mime,
             type="primary"
         )
 
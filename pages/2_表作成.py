@@ -23,8 +23,10 @@ try:
         import auth_manager
     except ImportError:
         import auth_maneger as auth_manager
+    # LaTeX 生成 (色なしバージョン)
+    from latex_table import MergeIndex, TableBuffer, generate_custom_latex
 except ImportError:
-    st.error("必要なモジュール (style.py, auth_manager.py) が見つかりません。")
+    st.error("必要なモジュール (style.py, auth_manager.py, latex_table.py) が見つかりません。")
     st.stop()
 
 style.apply_custom_style()
@@ -34,39 +36,23 @@ style.apply_custom_style()
 # ---------------------------------------------------------
 
 def resize_dataframe(df, target_rows, target_cols):
-    current_rows, current_cols = df.shape
-
-    # 行の調整
-    if target_rows < current_rows:
-        df = df.iloc[:target_rows, :]
-    elif target_rows > current_rows:
-        rows_to_add = target_rows - current_rows
-        new_rows = pd.DataFrame([[""] * current_cols] * rows_to_add, columns=df.columns)
-        df = pd.concat([df, new_rows], ignore_index=True)
-
-    # 列の調整
-    current_rows, current_cols = df.shape
-    if target_cols < current_cols:
-        df = df.iloc[:, :target_cols]
-    elif target_cols > current_cols:
-        for _ in range(target_cols - current_cols):
-            new_col = f"列 {len(df.columns) + 1}"
-            base = new_col
-            n = 1
-            while new_col in df.columns:
-                new_col = f"{base}_{n}"
-                n += 1
-            df[new_col] = ""
-
-    return df
+    """
+    表を target_rows × target_cols に変更する
+    容量を倍々で確保したバッファ (TableBuffer) 上で行うので、表全体の再確保は起きない
+    """
+    buffer = st.session_state.get("table_buffer")
+    if buffer is None or (buffer.rows, buffer.cols) != df.shape:
+        buffer = TableBuffer(df)
+        st.session_state.table_buffer = buffer
+    else:
+        buffer.sync(df)
+
+    buffer.resize(target_rows, target_cols)
+    return buffer.frame()
 
 
 def clean_merges(merges, rows, cols):
-    valid = []
-    for m in merges:
-        if m["r"] + m["rs"] <= rows and m["c"] + m["cs"] <= cols:
-            valid.append(m)
-    return valid
+    return merges.clip(rows, cols)
 
 
 def on_shape_change():
@@ -114,92 +100,36 @@ def update_input_vals(action, axis):
 # ---------------------------------------------------------
 # UIハイライト用関数 (Pandas Styler)
 # ---------------------------------------------------------
-def highlight_merges(df):
+# プレビューで一度に表示する行数
+PREVIEW_PAGE_ROWS = 50
+
+
+def merge_style_mask(shape):
     """
-    結合されているセルに対して背景色を設定するスタイル関数
+    表全体の結合セルマスク
+    結合リストか表の形が変わったときだけ作り直し、それ以外はセッション内のキャッシュを返す
     """
-    # 全て空文字（スタイルなし）で初期化
-    style_df = pd.DataFrame('', index=df.index, columns=df.columns)
-    
-    if "merge_list" in st.session_state:
-        for m in st.session_state.merge_list:
-            r, c, rs, cs = m["r"], m["c"], m["rs"], m["cs"]
-            # 結合範囲に色（薄いオレンジ）を適用
-            style_df.iloc[r:r+rs, c:c+cs] = 'background-color: #ffeeba; color: black;'
-            
-    return style_df
+    if "merge_list" not in st.session_state:
+        return np.zeros(shape, dtype=bool)
 
-# ---------------------------------------------------------
-# LaTeX 生成 (色なしバージョンに戻しました)
-# ---------------------------------------------------------
+    key = (st.session_state.merge_list.version, shape)
+    cached = st.session_state.get("merge_mask_cache")
+    if cached is None or cached[0] != key:
+        cached = (key, st.session_state.merge_list.covered_mask(shape))
+        st.session_state.merge_mask_cache = cached
+    return cached[1]
+
+
+def highlight_merges(df, start=0, shape=None):
+    """
+    結合されているセルに対して背景色を設定するスタイル関数
+    df は表の一部 (start 行目から) でもよく、その範囲のスタイルだけを作る
+    """
+    covered = merge_style_mask(shape or df.shape)[start:start + len(df)]
 
-def generate_custom_latex(df, merges, caption, label, col_fmt, use_booktabs, center):
-    rows, cols = df.shape
-
-    skip = np.zeros((rows, cols), dtype=bool)
-    merge_map = {}
-
-    for m in merges:
-        r, c, rs, cs = m["r"], m["c"], m["rs"], m["cs"]
-        merge_map[(r, c)] = (rs, cs)
-        for i in range(r, r + rs):
-            for j in range(c, c + cs):
-                if (i, j) != (r, c):
-                    skip[i, j] = True
-
-    top = "\\toprule" if use_booktabs else "\\hline"
-    mid = "\\midrule" if use_booktabs else "\\hline"
-    bottom = "\\bottomrule" if use_booktabs else "\\hline"
-
-    lines = []
-    lines.append("\\begin{table}[htbp]")
-    if center:
-        lines.append("  \\centering")
-
-    if caption:
-        lines.append(f"  \\caption{{{caption}}}")
-    if label:
-        lines.append(f"  \\label{{{label}}}")
-
-    lines.append(f"  \\begin{{tabular}}{{{col_fmt}}}")
-    lines.append(f"    {top}")
-
-    # header
-    header = " & ".join([f"\\textbf{{{c}}}" for c in df.columns]) + " \\\\"
-    lines.append("    " + header)
-    lines.append(f"    {mid}")
-
-    # body
-    for i in range(rows):
-        row_cells = []
-        for j in range(cols):
-            if skip[i, j]:
-                continue
-
-            text = str(df.iloc[i, j])
-
-            if (i, j) in merge_map:
-                rs, cs = merge_map[(i, j)]
-                if rs > 1 and cs > 1:
-                    cell = "\\multicolumn{" + str(cs) + "}{c}{\\multirow{" + str(rs) + "}{*}{" + text + "}}"
-                elif rs > 1:
-                    cell = "\\multirow{" + str(rs) + "}{*}{" + text + "}"
-                elif cs > 1:
-                    cell = "\\multicolumn{" + str(cs) + "}{c}{" + text + "}"
-                else:
-                    cell = text
-            else:
-                cell = text
-
-            row_cells.append(cell)
-
-        lines.append("    " + " & ".join(row_cells) + " \\\\")
-
-    lines.append(f"    {bottom}")
-    lines.append("  \\end{tabular}")
-    lines.append("\\end{table}")
-
-    return "\n".join(lines)
+    # 結合範囲に色（薄いオレンジ）を適用、それ以外は空文字（スタイルなし）
+    css = np.where(covered, 'background-color: #ffeeba; color: black;', '')
+    return pd.DataFrame(css, index=df.index, columns=df.columns)
 
 # ---------------------------------------------------------
 # Merge 管理
@@ -207,14 +137,19 @@ def generate_custom_latex(df, merges, caption, label, col_fmt, use_booktabs, cen
 
 def add_merge():
     if "merge_list" not in st.session_state:
-        st.session_state.merge_list = []
+        st.session_state.merge_list = MergeIndex()
 
-    st.session_state.merge_list.append({
-        "r": st.session_state.merge_r_input - 1,
-        "c": st.session_state.merge_c_input - 1,
-        "rs": st.session_state.merge_rs_input,
-        "cs": st.session_state.merge_cs_input
-    })
+    st.session_state.merge_error = None
+    try:
+        # 既存の結合と重なる場合は追加しない
+        st.session_state.merge_list.add({
+            "r": st.session_state.merge_r_input - 1,
+            "c": st.session_state.merge_c_input - 1,
+            "rs": st.session_state.merge_rs_input,
+            "cs": st.session_state.merge_cs_input
+        })
+    except ValueError as e:
+        st.session_state.merge_error = str(e)
 
 
 def remove_merge(i):
@@ -231,7 +166,7 @@ if "df" not in st.session_state:
     )
 
 if "merge_list" not in st.session_state:
-    st.session_state.merge_list = []
+    st.session_state.merge_list = MergeIndex()
 
 if "rows_input" not in st.session_state:
     st.session_state.rows_input = len(st.session_state.df)
@@ -313,11 +248,29 @@ with st.expander("セルの結合設定", expanded=False):
     with add:
         st.write(""); st.write("")
         st.button("追加", key="merge_add", on_click=add_merge)
+
+    if st.session_state.get("merge_error"):
+        st.error(st.session_state.merge_error)
     
     # --- 結合確認用プレビュー (色付き) ---
     st.write("▼ **結合状態プレビュー**（黄色いエリアが結合されます）")
+
+    # 大きな表は表示中のページ分だけスタイルを付けて送る
+    full_df = st.session_state.df
+    n_rows = len(full_df)
+    n_pages = max(1, -(-n_rows // PREVIEW_PAGE_ROWS))
+    start = 0
+    if n_pages > 1:
+        # 行数が減ってページが無くなった場合は最後のページに戻す
+        if st.session_state.get("merge_preview_page", 1) > n_pages:
+            st.session_state.merge_preview_page = n_pages
+        page = st.number_input("表示ページ", 1, n_pages, key="merge_preview_page")
+        start = (page - 1) * PREVIEW_PAGE_ROWS
+        st.caption(f"全 {n_rows} 行中 {start + 1}〜{min(start + PREVIEW_PAGE_ROWS, n_rows)} 行目を表示")
+    window_df = full_df.iloc[start:start + PREVIEW_PAGE_ROWS]
+
     st.dataframe(
-        st.session_state.df.style.apply(lambda _: highlight_merges(st.session_state.df), axis=None),
+        window_df.style.apply(lambda _: highlight_merges(window_df, start, full_df.shape), axis=None),
         use_container_width=True,
         height=200 # 高さを制限
     )
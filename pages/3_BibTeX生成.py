@@ -1,24 +1,260 @@
 import streamlit as st
 import sys
 import os
+import re
 
 # Webアプリ用にパス調整（既存コードのまま）
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import style
 import auth_manager
+import bibtex_index
+import doi_resolver
+
+# 一括生成で扱うフィールド (出力順)
+BATCH_FIELDS = [
+    "author", "title", "year", "journal", "volume", "number", "pages",
+    "publisher", "address", "booktitle", "howpublished", "note", "month",
+    "doi", "isbn", "url", "abstract",
+]
+
+# 表の列名 -> BibTeX フィールド の自動対応 (小文字で比較)
+COLUMN_ALIASES = {
+    "entry_type": ["entry_type", "type", "entrytype", "文献タイプ", "種類"],
+    "key": ["key", "citation_key", "citekey", "id", "引用ラベル", "引用キー"],
+    "author": ["author", "authors", "著者"],
+    "title": ["title", "タイトル", "題名"],
+    "year": ["year", "発行年", "年"],
+    "journal": ["journal", "ジャーナル", "雑誌"],
+    "volume": ["volume", "巻"],
+    "number": ["number", "issue", "号"],
+    "pages": ["pages", "page", "ページ"],
+    "publisher": ["publisher", "出版社"],
+    "address": ["address", "出版地"],
+    "booktitle": ["booktitle", "会議名"],
+    "howpublished": ["howpublished", "url/公開方法"],
+    "note": ["note", "備考"],
+    "month": ["month", "月"],
+    "doi": ["doi"],
+    "isbn": ["isbn"],
+    "url": ["url", "link"],
+    "abstract": ["abstract", "概要"],
+}
 
 def generate_bibtex_entry(entry_type, key, fields):
-    bibtex = f"@{entry_type}{{{key},\n"
+    lines = [f"@{entry_type}{{{key},\n"]
     for field, value in fields.items():
         if value:
             if field == 'title': 
-                bibtex += f"  {field} = {{{{{value}}}}},\n"
+                lines.append(f"  {field} = {{{{{value}}}}},\n")
             elif field == 'howpublished' and value.startswith(('http', 'https')) and '\\url' not in value:
-                bibtex += f"  {field} = {{\\url{{{value}}}}},\n"
+                lines.append(f"  {field} = {{\\url{{{value}}}}},\n")
             else: 
-                bibtex += f"  {field} = {{{value}}},\n"
-    bibtex += "}\n" # 末尾に改行を入れておく
-    return bibtex
+                lines.append(f"  {field} = {{{value}}},\n")
+    lines.append("}\n") # 末尾に改行を入れておく
+    return "".join(lines)
+
+def auto_map_columns(columns):
+    """表の列名から BibTeX フィールドへの対応を推測する"""
+    lowered = {str(c).strip().lower(): c for c in columns}
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in lowered:
+                mapping[field] = lowered[alias]
+                break
+    return mapping
+
+def make_citation_key(fields):
+    """著者の姓 + 発行年 からキーを作る (例: smith2020)"""
+    author = fields.get("author", "")
+    first = author.split(" and ")[0].strip()
+    surname = first.split(",")[0] if "," in first else (first.split()[-1] if first.split() else "")
+    surname = re.sub(r"[^0-9A-Za-z]", "", surname).lower()
+    year = re.sub(r"[^0-9]", "", fields.get("year", ""))
+    return (surname or "ref") + year
+
+def resolve_citation_key(key, taken):
+    """
+    既存キー (小文字の集合) と衝突しないキーを返す
+    衝突時は a, b, c ... (使い切ったら _2, _3 ...) を付ける
+    """
+    if key.lower() not in taken:
+        return key
+    for suffix in "abcdefghijklmnopqrstuvwxyz":
+        if (key + suffix).lower() not in taken:
+            return key + suffix
+    n = 2
+    while f"{key}_{n}".lower() in taken:
+        n += 1
+    return f"{key}_{n}"
+
+def _cell_text(value):
+    """表のセル値を BibTeX の値の文字列にする (欠損は空文字)"""
+    try:
+        if value is None or value != value:  # None / NaN
+            return ""
+    except TypeError:
+        # pd.NA (Parquet / Feather の列の欠損) は真偽値にできない
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def get_metadata_resolver():
+    """DOI / ISBN の書誌情報リゾルバ (st.secrets["metadata"] があればその設定を使う)"""
+    # secrets.toml が無い環境でも例外にせず、環境変数の設定で動かす
+    return doi_resolver.get_resolver(auth_manager.get_secrets_section("metadata"))
+
+def _remember_entries(state_key, source_id, entries):
+    """生成したエントリを覚えておく (ダウンロードボタンを押した後の再実行でもボタンを出し続ける)"""
+    st.session_state[state_key] = {"source": source_id, "entries": list(entries)}
+
+def _render_download(state_key, source_id, existing_bytes, dl_filename):
+    """生成済みのエントリがあれば、既存ファイルの後ろに追記したものをダウンロードするボタンを出す"""
+    result = st.session_state.get(state_key)
+    # 別のファイルをアップロードし直したときは、前のファイル向けに作った結果を使わない
+    if not result or result["source"] != source_id:
+        return
+    # 元のファイルのバイト列はそのまま、新しいエントリだけを後ろに足す
+    writer = bibtex_index.BibWriter(existing_bytes)
+    for entry in result["entries"]:
+        writer.append(entry)
+    st.download_button(
+        label=f"更新された {dl_filename} をダウンロード",
+        data=writer.getvalue,
+        file_name=dl_filename,
+        mime="text/plain"
+    )
+
+def generate_bibtex_batch(df, mapping, default_type, taken_keys, entry_types, resolved=None):
+    """
+    表の各行から BibTeX エントリを生成する
+    - mapping: BibTeX フィールド (entry_type / key を含む) -> 列名
+    - taken_keys: 既存ファイルのキー (小文字)。生成したキーも追加していく
+    - resolved: DOI 列の値 -> (エントリタイプ, フィールド)。表の空欄をこれで補う
+    返り値: (エントリ文字列のリスト, [(元のキー, 変更後のキー), ...])
+    """
+    taken = set(taken_keys)
+    entries = []
+    renamed = []
+    columns = {field: df[col].tolist() for field, col in mapping.items()}
+    for i in range(len(df)):
+        fields = {}
+        for field in BATCH_FIELDS:
+            if field in columns:
+                text = _cell_text(columns[field][i])
+                if text:
+                    fields[field] = text
+        # DOI 列に ISBN が書かれていれば isbn として扱う
+        doi_id = doi_resolver.normalize_identifier(fields.get("doi"))
+        if doi_id is not None and doi_id.startswith("isbn:") and not fields.get("isbn"):
+            fields["isbn"] = fields.pop("doi")
+        meta_type = None
+        if resolved:
+            for id_field in ("doi", "isbn"):
+                if fields.get(id_field) in resolved:
+                    meta_type, meta_fields = resolved[fields[id_field]]
+                    for field, value in meta_fields.items():
+                        fields.setdefault(field, value)
+                    break
+            fields = {f: fields[f] for f in BATCH_FIELDS if f in fields}
+        if not fields.get("title"):
+            # タイトルの無い行は読み飛ばす
+            continue
+
+        entry_type = _cell_text(columns["entry_type"][i]).lower() if "entry_type" in columns else ""
+        if entry_type not in entry_types:
+            entry_type = meta_type if meta_type in entry_types else default_type
+
+        key = _cell_text(columns["key"][i]) if "key" in columns else ""
+        key = re.sub(r"\s+", "", key) or make_citation_key(fields)
+        new_key = resolve_citation_key(key, taken)
+        if new_key != key:
+            renamed.append((key, new_key))
+        taken.add(new_key.lower())
+
+        entries.append(generate_bibtex_entry(entry_type, new_key, fields))
+    return entries, renamed
+
+def batch_mode(ENTRY_TYPES, existing_bytes, bib_index, dl_filename, source_id=None):
+    """表 (CSV / Excel) から一括で BibTeX を生成する画面"""
+    # pandas はこの画面で表を読むときだけ必要
+    import data_loader
+
+    st.markdown("### 2. 文献リスト (表) のアップロード")
+    st.caption("1 行 = 1 文献。列名が author / title / year などの場合は自動で対応付けます。")
+    table_file = st.file_uploader("CSV / Excel ファイル", type=["csv", "xlsx"], key="batch_table")
+    if table_file is None:
+        st.info("文献リストの表をアップロードしてください。")
+        return
+
+    try:
+        sheet_name = None
+        if data_loader.file_extension(table_file.name) == '.xlsx':
+            sheet_names = data_loader.get_sheet_names(table_file)
+            sheet_name = st.selectbox("対象のシート", sheet_names) if len(sheet_names) > 1 else sheet_names[0]
+        df = data_loader.read_table(table_file, sheet_name=sheet_name)
+    except Exception as e:
+        st.error(f"読み込みエラー: {e}")
+        return
+
+    st.dataframe(df.head(20), use_container_width=True, height=200)
+
+    # --- 列の対応付け ---
+    auto_mapping = auto_map_columns(df.columns)
+    none_label = "(なし)"
+    options = [none_label] + list(df.columns)
+    mapping = {}
+    with st.expander("列の対応付け", expanded=False):
+        default_type = st.selectbox(
+            "文献タイプ列が空のときのタイプ", list(ENTRY_TYPES.keys()),
+            format_func=lambda x: ENTRY_TYPES[x], key="batch_default_type"
+        )
+        ui_cols = st.columns(3)
+        for i, field in enumerate(["entry_type", "key"] + BATCH_FIELDS):
+            default = auto_mapping.get(field, none_label)
+            chosen = ui_cols[i % 3].selectbox(
+                field, options, index=options.index(default), key=f"batch_map_{field}"
+            )
+            if chosen != none_label:
+                mapping[field] = chosen
+
+    use_lookup = False
+    if "doi" in mapping or "isbn" in mapping:
+        use_lookup = st.checkbox("DOI / ISBN から空欄を自動補完する", value=True, key="batch_lookup")
+    elif "title" not in mapping:
+        st.warning("title に対応する列を指定してください。")
+        return
+
+    if st.button("一括生成する", type="primary", key="batch_generate"):
+        st.session_state.pop("bib_batch_result", None)
+        resolved = None
+        if use_lookup:
+            identifiers = [
+                _cell_text(v) for field in ("doi", "isbn") if field in mapping
+                for v in df[mapping[field]].tolist()
+            ]
+            try:
+                with st.spinner("書誌情報を取得中..."):
+                    resolved = get_metadata_resolver().resolve_many([i for i in identifiers if i])
+                st.info(f"{len(resolved)} 件の書誌情報を取得しました。")
+            except Exception as e:
+                st.error(f"書誌情報の取得に失敗しました (表の内容だけで生成します): {e}")
+        taken = {k.lower() for k in bib_index.keys()} if bib_index is not None else set()
+        entries, renamed = generate_bibtex_batch(df, mapping, default_type, taken, ENTRY_TYPES, resolved)
+        if not entries:
+            st.warning("生成できる行がありませんでした (タイトルが空の行は読み飛ばします)。")
+            return
+        _remember_entries("bib_batch_result", source_id, entries)
+
+        st.success(f"{len(entries)} 件のエントリを生成しました。")
+        if renamed:
+            with st.expander(f"キーの重複を解消した {len(renamed)} 件"):
+                st.text("\n".join(f"{old} → {new}" for old, new in renamed))
+        st.text("生成内容 (先頭 5 件):")
+        st.code("\n".join(entries[:5]), language='latex')
+
+    _render_download("bib_batch_result", source_id, existing_bytes, dl_filename)
 
 def main():
     st.set_page_config(page_title="BibTeX Generator (Web版)")
@@ -33,8 +269,21 @@ def main():
         "inproceedings": "会議録 (Inproceedings)", "phdthesis": "博士論文 (PhdThesis)",
         "techreport": "技術報告書 (TechReport)", "website": "ウェブサイト (Website)", "misc": "その他 (Misc)"
     }
-    entry_type = st.sidebar.selectbox("文献タイプ", list(ENTRY_TYPES.keys()), format_func=lambda x: ENTRY_TYPES[x])
-    citation_key = st.sidebar.text_input("引用ラベル (ユニークなID)", "ref_key")
+    # DOI / ISBN から取得した内容を、ウィジェットを作る前に入力欄へ反映する
+    prefill = st.session_state.pop("bib_prefill", None)
+    if prefill is not None:
+        meta_type, meta_fields = prefill
+        if meta_type in ENTRY_TYPES:
+            st.session_state["entry_type"] = meta_type
+        st.session_state["citation_key"] = make_citation_key(meta_fields)
+        for field, value in meta_fields.items():
+            st.session_state[f"field_{field}"] = value
+    st.session_state.setdefault("citation_key", "ref_key")
+
+    input_mode = st.sidebar.radio("入力方法", ["フォーム (1件ずつ)", "表から一括生成"])
+    if input_mode == "フォーム (1件ずつ)":
+        entry_type = st.sidebar.selectbox("文献タイプ", list(ENTRY_TYPES.keys()), format_func=lambda x: ENTRY_TYPES[x], key="entry_type")
+        citation_key = st.sidebar.text_input("引用ラベル (ユニークなID)", key="citation_key")
 
         # 1. 認証チェック
     auth_manager.check_auth()
@@ -43,91 +292,110 @@ def main():
     st.markdown("### 1. 既存の.bibファイルをアップロード")
     uploaded_file = st.file_uploader("手元の .bib ファイルをここにドラッグ＆ドロップ", type=['bib'])
     
-    existing_content = ""
+    existing_bytes = b""
+    bib_index = None
+    source_id = None
+    dl_filename = uploaded_file.name if uploaded_file else "references.bib"
     if uploaded_file is not None:
-        # アップロードされたファイルを読み込む
-        stringio = uploaded_file.getvalue().decode("utf-8")
-        existing_content = stringio
-        st.success(f"`{uploaded_file.name}` を読み込みました。ここに新しい文献を追記します。")
+        source_id = uploaded_file.file_id
+        # アップロードされたファイルはバイト列のまま保持する (文字列へのデコードはしない)
+        existing_bytes = uploaded_file.getvalue()
+        # 引用キーの索引 (内容ハッシュでキャッシュされるので再実行時は走査しない)
+        bib_index = bibtex_index.get_index(existing_bytes)
+        st.success(f"`{uploaded_file.name}` を読み込みました ({len(bib_index)} 件)。ここに新しい文献を追記します。")
     else:
         st.warning("ファイルがアップロードされていない場合は、新規作成")
 
     st.markdown("---")
+
+    if input_mode == "表から一括生成":
+        batch_mode(ENTRY_TYPES, existing_bytes, bib_index, dl_filename, source_id)
+        return
+
     st.markdown("### 2. 文献情報の入力")
+
+    # --- DOI / ISBN から自動入力 ---
+    lookup_col1, lookup_col2 = st.columns([3, 1])
+    with lookup_col1:
+        lookup_id = st.text_input("DOI / ISBN から自動入力", placeholder="例: 10.1038/nature12373 / 978-4-00-000000-0")
+    with lookup_col2:
+        st.write("")
+        st.write("")
+        do_lookup = st.button("取得", key="lookup_button")
+    if do_lookup:
+        if doi_resolver.normalize_identifier(lookup_id) is None:
+            st.warning("DOI または ISBN として解釈できません。")
+        else:
+            try:
+                with st.spinner("書誌情報を取得中..."):
+                    result = get_metadata_resolver().resolve(lookup_id)
+            except Exception as e:
+                st.error(f"書誌情報の取得に失敗しました: {e}")
+            else:
+                if result is None:
+                    st.warning("該当する書誌情報が見つかりませんでした。")
+                else:
+                    st.session_state["bib_prefill"] = result
+                    st.rerun()
     
     st.header(f"{ENTRY_TYPES[entry_type]} 情報")
     fields = {}
     col1, col2 = st.columns(2)
     with col1:
-        fields['author'] = st.text_input("著者")
-        fields['title'] = st.text_input("タイトル")
-        fields['year'] = st.text_input("発行年")
+        fields['author'] = st.text_input("著者", key="field_author")
+        fields['title'] = st.text_input("タイトル", key="field_title")
+        fields['year'] = st.text_input("発行年", key="field_year")
     with col2:
         if entry_type == 'article':
-            fields['journal'] = st.text_input("ジャーナル")
-            fields['volume'] = st.text_input("巻")
-            fields['number'] = st.text_input("号")
-            fields['pages'] = st.text_input("ページ")
+            fields['journal'] = st.text_input("ジャーナル", key="field_journal")
+            fields['volume'] = st.text_input("巻", key="field_volume")
+            fields['number'] = st.text_input("号", key="field_number")
+            fields['pages'] = st.text_input("ページ", key="field_pages")
         elif entry_type == 'book':
-            fields['publisher'] = st.text_input("出版社")
-            fields['address'] = st.text_input("出版地")
+            fields['publisher'] = st.text_input("出版社", key="field_publisher")
+            fields['address'] = st.text_input("出版地", key="field_address")
         elif entry_type == 'inproceedings':
-            fields['booktitle'] = st.text_input("会議名")
+            fields['booktitle'] = st.text_input("会議名", key="field_booktitle")
         elif entry_type in ['website', 'misc']:
-            fields['howpublished'] = st.text_input("URL/公開方法")
-            fields['note'] = st.text_input("備考")
-        if 'month' not in fields: fields['month'] = st.text_input("月")
+            fields['howpublished'] = st.text_input("URL/公開方法", key="field_howpublished")
+            fields['note'] = st.text_input("備考", key="field_note")
+        if 'month' not in fields: fields['month'] = st.text_input("月", key="field_month")
 
     with st.expander("その他"):
-        fields['doi'] = st.text_input("DOI")
-        fields['url'] = st.text_input("URL")
-        fields['abstract'] = st.text_area("概要")
+        fields['doi'] = st.text_input("DOI", key="field_doi")
+        fields['url'] = st.text_input("URL", key="field_url")
+        fields['abstract'] = st.text_area("概要", key="field_abstract")
 
     # --- 生成処理 ---
     new_bib_entry = ""
-    combined_content = ""
     
     # プレビュー用のコンテナ
     result_container = st.container()
 
     if st.button("生成する", type="primary"):
+        st.session_state.pop("bib_single_result", None)
         if not citation_key or not fields.get('title'):
             st.warning("引用キーとタイトルは必須です")
         else:
-            # 重複チェック
-            if f"{{{citation_key}," in existing_content:
-                st.error(f"エラー: 引用キー '{citation_key}' はアップロードされたファイル内に既に存在します。")
+            # 重複チェック (BibTeX はキーの大文字小文字を区別せず衝突とみなす)
+            duplicate = bib_index.get_ignore_case(citation_key) if bib_index is not None else None
+            if duplicate is not None:
+                st.error(f"エラー: 引用キー '{citation_key}' はアップロードされたファイル内に既に存在します (@{duplicate.entry_type}{{{duplicate.key}, ...}})。")
             else:
                 # 新しいエントリを作成
                 new_bib_entry = generate_bibtex_entry(entry_type, citation_key, fields)
-                
-                # 結合処理（改行を綺麗に入れる）
-                if existing_content:
-                    if not existing_content.endswith("\n"):
-                        combined_content = existing_content + "\n\n" + new_bib_entry
-                    elif not existing_content.endswith("\n\n"):
-                        combined_content = existing_content + "\n" + new_bib_entry
-                    else:
-                        combined_content = existing_content + new_bib_entry
-                else:
-                    combined_content = new_bib_entry
+                _remember_entries("bib_single_result", source_id, [new_bib_entry])
 
-                # 結果表示とダウンロードボタン
+                # 結果表示
                 with result_container:
                     st.success("生成完了！以下のボタンからダウンロードしてください。")
                     
                     st.text("今回追加される内容:")
                     st.code(new_bib_entry, language='latex')
-                    
-                    # ダウンロードファイル名の決定
-                    dl_filename = uploaded_file.name if uploaded_file else "references.bib"
-                    
-                    st.download_button(
-                        label=f"更新された {dl_filename} をダウンロード",
-                        data=combined_content,
-                        file_name=dl_filename,
-                        mime="text/plain"
-                    )
+
+    # ダウンロードボタン (結合は元のバイト列はそのまま、改行を綺麗に入れて追記する)
+    with result_container:
+        _render_download("bib_single_result", source_id, existing_bytes, dl_filename)
 
 if __name__ == "__main__":
     main()
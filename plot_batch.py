@@ -0,0 +1,202 @@
+# plot_batch.py
+"""
+散布図の一括描画 (散布図ページと同じ処理をコマンドラインから実行する)
+
+    python plot_batch.py data/ --spec plot.yaml --out figures/ --format png pdf
+    python plot_batch.py a.csv b.xlsx --spec plot.json -j 4
+
+設定ファイル (JSON / YAML) の項目は scatter_plot.DEFAULT_OPTIONS を参照
+"formats" / "dpi" も設定ファイルに書ける (コマンドライン引数が優先)
+grid を指定すると系列 (by: series) またはシート (by: sheet、xlsx のみ) ごとのパネルを 1 枚に並べる
+出力は <入力ファイル名から拡張子を除いたもの>.<形式> (a.csv と a.xlsx のように重なる場合は a.csv.png など)
+1 ファイル = 1 枚の図を、プロセスプールの各ワーカー (Agg バックエンド) で描画する
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import plot_setup
+import scatter_plot
+
+# ==========================================
+# 設定
+# ==========================================
+INPUT_EXTENSIONS = ('.csv', '.xlsx', '.parquet', '.feather', '.npy', '.npz')
+OUTPUT_FORMATS = ('png', 'pdf', 'svg', 'pgf')
+VECTOR_FORMATS = ('pdf', 'svg', 'pgf')
+DEFAULT_DPI = 300
+
+
+def load_spec(path):
+    """描画設定ファイル (.json / .yaml / .yml) を読む"""
+    if path is None:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML の設定ファイルを読むには PyYAML が必要です (JSON なら不要)。")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise ValueError("設定ファイルの最上位は key: value の形式にしてください。")
+    return spec or {}
+
+
+def find_inputs(paths):
+    """引数のファイル・ディレクトリから対象のデータファイルを集める (ディレクトリは直下のみ)"""
+    from data_loader import file_extension
+
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                if file_extension(name) in INPUT_EXTENSIONS and not name.startswith(('.', '~$')):
+                    files.append(os.path.join(p, name))
+        else:
+            files.append(p)
+    return files
+
+
+def output_names(files):
+    """
+    入力ファイルごとの出力名 (拡張子なし) を決める
+    基本は元のファイル名から拡張子を除いたもの、a.csv と a.xlsx のように重なるものは拡張子を残す
+    それでも重なる (別ディレクトリの同名ファイル) 場合は上書きを避けるため ValueError
+    """
+    stems = [os.path.splitext(os.path.basename(f))[0] for f in files]
+    # 大文字小文字を区別しないファイルシステム (Windows / macOS) でも重ならないようにする
+    counts = Counter(stem.lower() for stem in stems)
+    names = [os.path.basename(f) if counts[stem.lower()] > 1 else stem for f, stem in zip(files, stems)]
+    seen = {}
+    clashes = []
+    for f, name in zip(files, names):
+        other = seen.setdefault(name.lower(), f)
+        if other is not f:
+            clashes.append(f"{other} と {f}")
+    if clashes:
+        raise ValueError("出力ファイル名が重なります (--out を分けて実行してください): " + ", ".join(clashes))
+    return names
+
+
+def _column_pairs(df, columns):
+    if columns:
+        return [tuple(pair) for pair in columns]
+    names = list(df.columns)
+    if len(names) % 2 != 0:
+        raise ValueError(f"列数が奇数です ({len(names)} 列)。設定ファイルの columns で X/Y 列の組を指定してください。")
+    return [(names[i], names[i + 1]) for i in range(0, len(names), 2)]
+
+
+def render_file(path, options, out_dir, formats, dpi, rasterize_threshold, name=None):
+    """
+    1 ファイルを読み込んで図を描き、<name>.<形式> として保存する (ワーカープロセスで実行)
+    name を省略すると元のファイル名から拡張子を除いたものを使う
+    ベクター形式では、点数が rasterize_threshold 以上ならデータ点の層だけをラスタ化する
+    (PGF の場合、ラスタ化した層は <名前>-img0.png などとして同じディレクトリに保存される)
+    返り値: 保存したファイルのパスのリスト
+    """
+    import data_loader
+    from series_store import SeriesStore
+
+    source = data_loader.LocalFile(path)
+    sheet = options.get("sheet")
+    is_xlsx = data_loader.file_extension(source.name) == '.xlsx'
+    grid = options.get("grid")
+    sheet_groups = None
+    if is_xlsx and isinstance(grid, dict) and grid.get("by") == "sheet":
+        # シートごとに並べる: sheet にシート名のリストがあればそのシート、なければ全シート
+        if isinstance(sheet, list):
+            sheet_groups = [str(name) for name in sheet]
+        else:
+            sheet_groups = data_loader.get_sheet_names(source)
+        frames = {name: data_loader.read_table(source, sheet_name=name) for name in sheet_groups}
+        first = next(iter(frames.values()))
+        store = SeriesStore.from_frames(frames, _column_pairs(first, options.get("columns")),
+                                        err_cols=options.get("error_columns"))
+    else:
+        if is_xlsx and sheet is None:
+            sheet = 0
+        df = data_loader.read_table(source, sheet_name=sheet)
+        store = SeriesStore.from_frame(df, _column_pairs(df, options.get("columns")),
+                                       err_cols=options.get("error_columns"))
+    if store.empty:
+        raise ValueError("有効なデータがありません。")
+
+    rasterize = (
+        any(fmt in VECTOR_FORMATS for fmt in formats)
+        and scatter_plot.should_rasterize(store, rasterize_threshold)
+    )
+    fig, _ = scatter_plot.build_figure(store, options, rasterize_points=rasterize, sheet_groups=sheet_groups)
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    written = []
+    for fmt in formats:
+        out_path = os.path.join(out_dir, f"{name}.{fmt}")
+        fig.savefig(out_path, format=fmt, dpi=dpi, bbox_inches='tight')
+        written.append(out_path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="散布図の一括描画")
+    parser.add_argument("inputs", nargs="+", help="データファイルまたはディレクトリ")
+    parser.add_argument("--spec", help="描画設定ファイル (.json / .yaml)")
+    parser.add_argument("--out", default="figures", help="出力先ディレクトリ (既定: figures)")
+    parser.add_argument("--format", nargs="+", choices=OUTPUT_FORMATS, help="出力形式 (複数可、既定: png)")
+    parser.add_argument("--dpi", type=int, help=f"解像度 (既定: {DEFAULT_DPI})")
+    parser.add_argument("--rasterize-threshold", type=int, default=scatter_plot.RASTERIZE_POINT_THRESHOLD,
+                        help="ベクター形式でデータ点をラスタ化する点数 (0 でラスタ化しない)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="並列に描画するプロセス数")
+    args = parser.parse_args(argv)
+
+    options = load_spec(args.spec)
+    spec_formats = options.pop("formats", None)
+    spec_dpi = options.pop("dpi", None)
+    formats = args.format or spec_formats or ["png"]
+    dpi = args.dpi or spec_dpi or DEFAULT_DPI
+    unknown = sorted(set(options) - set(scatter_plot.DEFAULT_OPTIONS))
+    if unknown:
+        print(f"設定ファイルに不明な項目があります: {', '.join(unknown)}", file=sys.stderr)
+        return 1
+
+    files = find_inputs(args.inputs)
+    if not files:
+        print("対象のファイルがありません。", file=sys.stderr)
+        return 1
+    try:
+        names = output_names(files)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+
+    start = time.perf_counter()
+    failed = 0
+    # ワーカーごとに 1 回だけ Matplotlib (Agg・日本語フォント) を準備する
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=plot_setup.configure) as pool:
+        futures = {
+            pool.submit(render_file, f, options, args.out, formats, dpi, args.rasterize_threshold, name): f
+            for f, name in zip(files, names)
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                written = future.result()
+                print(f"ok    {path} -> {', '.join(written)}")
+            except Exception as e:
+                failed += 1
+                print(f"error {path}: {e}", file=sys.stderr)
+
+    print(f"{len(files) - failed}/{len(files)} files in {time.perf_counter() - start:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# plot_setup.py
+"""
+Matplotlib の初期設定と、フォントキャッシュの事前構築 (ウォームアップ)
+
+    python plot_setup.py    # デプロイ時に 1 回実行しておく
+
+フォント一覧のキャッシュ (fontlist-*.json) を Matplotlib のキャッシュディレクトリ
+(MPLCONFIGDIR、未設定なら ~/.cache/matplotlib など) に作っておくことで、
+散布図ページの最初の描画でフォントの再構築が走らないようにする
+rcParams はプロセス内で設定するだけで、アプリのディレクトリには何も書き込まない
+"""
+import threading
+import time
+
+# ==========================================
+# 設定
+# ==========================================
+# 全ての図に共通の rcParams
+RC_PROFILE = {
+    "backend": "Agg",                   # 画面を持たないサーバーでの描画
+    "font.family": "IPAexGothic",       # japanize_matplotlib が登録する日本語フォント
+    "axes.unicode_minus": False,        # 日本語フォントに無いマイナス記号を使わない
+}
+
+_configured = False
+_configure_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def configure():
+    """
+    描画前に呼ぶ (2 回目以降は何もしない)
+    日本語フォントを登録し、rcParams を RC_PROFILE にそろえる
+    """
+    global _configured
+    if _configured:
+        return
+    with _configure_lock:
+        if _configured:
+            return
+        import matplotlib
+        matplotlib.use(RC_PROFILE["backend"])
+        import japanize_matplotlib
+        matplotlib.rcParams.update({k: v for k, v in RC_PROFILE.items() if k != "backend"})
+        _configured = True
+
+
+def warm_up():
+    """
+    フォントキャッシュを構築し、日本語と数式を含む小さな図を 1 枚描いておく
+    (フォントの読み込み・グリフのキャッシュ・mathtext の初期化を済ませる)
+    返り値: かかった秒数
+    """
+    start = time.perf_counter()
+    configure()
+    import io
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(2, 1))
+    ax = fig.subplots()
+    ax.plot([0, 1], [0, 1], marker="o")
+    ax.set_xlabel("電圧 $V$ [V]")
+    ax.set_ylabel(r"$1.00 \times 10^{-3}$")
+    fig.savefig(io.BytesIO(), format="png", dpi=50)
+    return time.perf_counter() - start
+
+
+def pgf_available():
+    """PGF 出力に使う TeX (rcParams["pgf.texsystem"]、既定は xelatex) が使えるか"""
+    import shutil
+    configure()
+    import matplotlib
+    return shutil.which(matplotlib.rcParams["pgf.texsystem"]) is not None
+
+
+def warm_up_in_background():
+    """
+    ウォームアップを別スレッドで 1 回だけ始める (アプリ起動直後に呼ぶ)
+    リクエストの処理をブロックしない
+    """
+    global _warm_up_thread
+    with _configure_lock:
+        if _warm_up_thread is not None or _configured:
+            return
+        _warm_up_thread = threading.Thread(target=warm_up, name="plot-warm-up", daemon=True)
+    _warm_up_thread.start()
+
+
+if __name__ == "__main__":
+    seconds = warm_up()
+    import matplotlib
+    print(f"matplotlib font cache ready in {seconds:.2f}s ({matplotlib.get_cachedir()})")
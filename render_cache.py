@@ -0,0 +1,105 @@
+# render_cache.py
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import zipfile
+
+from data_loader import ParseCache
+
+# ==========================================
+# 設定
+# ==========================================
+PREVIEW_DPI = 200   # 画面表示用 (st.pyplot の既定値と同じ)
+EXPORT_DPI = 300    # ダウンロード用 (ベクター形式ではラスタ化する層の解像度)
+# ダウンロードできる形式 -> MIME タイプ
+EXPORT_FORMATS = {
+    "png": "image/png",
+    "pdf": "application/pdf",
+    "svg": "image/svg+xml",
+    "pgf": "application/x-tex",
+}
+PREVIEW_CACHE_MAX_BYTES = 64 * 1024 * 1024
+EXPORT_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# 描画済み画像のキャッシュ (全セッション共有)
+_preview_cache = ParseCache(max_bytes=PREVIEW_CACHE_MAX_BYTES)
+_export_cache = ParseCache(max_bytes=EXPORT_CACHE_MAX_BYTES)
+
+
+def spec_key(spec):
+    """描画設定 (dict) からキャッシュキーを作る"""
+    payload = json.dumps(spec, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+
+def render_png(build_figure, dpi):
+    """Figure を生成して PNG バイト列に変換する"""
+    return render_file(build_figure, "png", dpi)
+
+
+def render_file(build_figure, fmt, dpi, name="figure"):
+    """
+    Figure を生成して fmt 形式のバイト列に変換する
+    PGF はラスタ化した層を別の PNG ファイル (name-img0.png など) に書き出すので、
+    その場合は .pgf と画像をまとめた zip を返す
+    描画後は必ず Figure を閉じ、pyplot 側に残さない
+    (pyplot が読み込まれていなければ pyplot 管理の Figure も無いので何もしない)
+    """
+    fig = build_figure()
+    try:
+        if fmt != "pgf":
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches='tight')
+            return buf.getvalue()
+        with tempfile.TemporaryDirectory() as tmp:
+            fig.savefig(os.path.join(tmp, name + ".pgf"), format="pgf", dpi=dpi, bbox_inches='tight')
+            files = sorted(os.listdir(tmp))
+            if files == [name + ".pgf"]:
+                with open(os.path.join(tmp, files[0]), "rb") as f:
+                    return f.read()
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+                for file_name in files:
+                    zf.write(os.path.join(tmp, file_name), file_name)
+            return buf.getvalue()
+    finally:
+        plt = sys.modules.get("matplotlib.pyplot")
+        if plt is not None:
+            plt.close(fig)
+
+
+def _cached_png(cache, spec, build_figure, dpi):
+    key = (spec_key(spec), dpi)
+    png = cache.get(key)
+    if png is None:
+        png = render_png(build_figure, dpi)
+        cache.put(key, png, len(png))
+    return png
+
+
+def preview_png(spec, build_figure):
+    """プレビュー用 PNG (描画設定が同じならキャッシュを返す)"""
+    return _cached_png(_preview_cache, spec, build_figure, PREVIEW_DPI)
+
+
+def export_png(spec, build_figure):
+    """ダウンロード用の高解像度 PNG (ダウンロード時にのみ呼ぶ)"""
+    return _cached_png(_export_cache, spec, build_figure, EXPORT_DPI)
+
+
+def export_file(spec, build_figure, fmt, rasterize_points=False, name="figure"):
+    """
+    ダウンロード用のファイル (PNG / PDF / SVG / PGF) (ダウンロード時にのみ呼ぶ)
+    ラスタ化の有無と PGF の画像ファイル名も結果に影響するのでキーに含める
+    """
+    if fmt == "png":
+        return export_png(spec, build_figure)
+    key = (spec_key(spec), fmt, EXPORT_DPI, rasterize_points, name if fmt == "pgf" else None)
+    data = _export_cache.get(key)
+    if data is None:
+        data = render_file(build_figure, fmt, EXPORT_DPI, name)
+        _export_cache.put(key, data, len(data))
+    return data
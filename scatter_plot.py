@@ -0,0 +1,435 @@
+# scatter_plot.py
+"""
+散布図ツールの描画処理 (Streamlit に依存しない部分)
+散布図ページと一括描画 CLI (plot_batch.py) の両方から使う
+"""
+import math
+from functools import lru_cache
+
+import numpy as np
+
+import fitting
+import plot_setup
+from series_store import FRAME_NAME_SEPARATOR
+
+# ==========================================
+# 設定
+# ==========================================
+# 描画設定の既定値 (CLI の設定ファイルで省略した項目に使う)
+DEFAULT_OPTIONS = {
+    "columns": None,        # [[X列, Y列], ...]。省略時は全列を先頭から 2 列ずつ組にする
+    "sheet": None,          # xlsx のシート名 (省略時は先頭のシート。grid の by: sheet ではシート名のリスト)
+    "auto_scale_x": False,
+    "auto_scale_y": True,
+    "x_label": None,        # 省略時は最初の組の列名
+    "y_label": None,
+    "legend": None,         # 系列ごとの凡例名 (省略時は X 列名)
+    "fits": [],             # 近似範囲 [[x_min, x_max], ...] (スケール後の X 座標)
+    "extend_full": True,
+    "model": "linear",      # 近似モデル (fitting.FIT_MODELS のキー)
+    "degree": 2,            # model: poly のときの次数
+    "error_columns": None,  # 列の組ごとの Y 誤差の列名 (null で誤差なし)。指定すると重み 1/σ² で近似する
+    "show_errors": False,   # 凡例の近似式にパラメータの不確かさ (±1σ) を付ける
+    "grid": None,           # グリッド表示 {"by": "series" | "sheet", "ncols": 2, "share_axes": true} (省略時は 1 枚に重ねる)
+}
+
+# 系列ごとの色・マーカーと、近似直線ごとの線種
+COLORS = ['black', 'blue', 'red', 'orange', 'green', 'purple', 'brown']
+MARKERS = ['o', 's', '^', 'D', 'v', '<', '>']
+LINESTYLES = ['--', '-.', ':', '--', '-.']
+
+# 凡例の (a ± b) 表記で使う小数点以下の最大桁数
+MAX_PM_DECIMALS = 6
+
+# グリッド表示の 1 パネルあたりの大きさ (インチ)
+GRID_PANEL_SIZE = (4.0, 3.0)
+GRID_DEFAULT_COLUMNS = 2
+
+# ベクター形式 (PDF / SVG / PGF) で保存するとき、全系列の点数がこれ以上ならデータ点の層だけをラスタ化する
+# (軸・ラベル・近似直線はベクターのまま)
+RASTERIZE_POINT_THRESHOLD = 5000
+
+# ---------------------------------------------------------
+# ユーティリティ関数
+# ---------------------------------------------------------
+def get_auto_scale_info(max_val):
+    if max_val == 0 or np.isnan(max_val):
+        return 1.0, "", 0
+    exponent = math.floor(math.log10(max_val) / 3) * 3
+    if exponent == 0:
+        return 1.0, "", 0
+    si_prefixes = {
+        -12: 'p', -9: 'n', -6: r'$\mu$', -3: 'm', 
+        0: '', 3: 'k', 6: 'M', 9: 'G', 12: 'T'
+    }
+    scale_factor = 10 ** (-exponent)
+    prefix = si_prefixes.get(exponent, "")
+    return scale_factor, prefix, exponent
+
+@lru_cache(maxsize=1024)
+def to_latex_sci(x):
+    """
+    数値をLaTeX形式の文字列に変換する関数
+    - 指数が -1, 0, 1 の場合は通常の小数表記にする
+    - それ以外は a \times 10^b の形式にする
+    """
+    if x == 0:
+        return "0"
+    
+    exponent = int(math.floor(math.log10(abs(x))))
+    
+    if exponent in [-1, 0, 1]:
+        return f"{x:.3g}"
+
+    mantissa = x / (10 ** exponent)
+    return f"{mantissa:.2f} \\times 10^{{{exponent}}}"
+
+def to_latex_pm(x, err):
+    """
+    値と誤差を LaTeX 形式の (a \pm b) \times 10^n に変換する関数
+    - 指数は値に合わせて共通にする (to_latex_sci と同じく -1, 0, 1 は 10^n を付けない)
+    - 小数点以下の桁数は誤差の有効数字が 2 桁見えるようにそろえる (最低 2 桁)
+    - それでも MAX_PM_DECIMALS 桁を超えるほど誤差が小さいときは、誤差だけ to_latex_sci で書く
+    """
+    if not np.isfinite(err):
+        return to_latex_sci(x)
+    err = abs(err)
+    ref = abs(x) if x != 0 else err
+    if ref == 0:
+        return "0"
+    exponent = int(math.floor(math.log10(ref)))
+    if exponent in [-1, 0, 1]:
+        exponent = 0
+    scale = 10 ** exponent
+    mantissa, err_mantissa = x / scale, err / scale
+    decimals = 2 if err_mantissa == 0 else max(2, 1 - int(math.floor(math.log10(err_mantissa))))
+    if decimals > MAX_PM_DECIMALS:
+        body = f"{mantissa:.2f} \\pm {to_latex_sci(err_mantissa)}"
+    else:
+        body = f"{mantissa:.{decimals}f} \\pm {err_mantissa:.{decimals}f}"
+    if exponent == 0:
+        return f"({body})"
+    return f"({body}) \\times 10^{{{exponent}}}"
+
+def fit_equation(model, params, errors=None):
+    """
+    近似式の LaTeX 文字列 (凡例用、$ は含まない)
+    errors を渡すと各係数に ±1σ を付ける
+    """
+    def coef(i, value):
+        if errors is None:
+            return to_latex_sci(value)
+        return to_latex_pm(value, errors[i])
+
+    if model == "exp":
+        return f"y = {coef(0, params[0])} \\exp({coef(1, params[1])}x)"
+    if model == "power":
+        return f"y = {coef(0, params[0])} x^{{{coef(1, params[1])}}}"
+
+    # 直線・多項式: 次数の高い項から並べる (直線は従来どおり y = ax + b)
+    terms = []
+    for k in range(len(params) - 1, -1, -1):
+        power = "" if k == 0 else ("x" if k == 1 else f"x^{{{k}}}")
+        if not terms:
+            terms.append(f"{coef(k, params[k])}{power}")
+        else:
+            sign = "+" if params[k] >= 0 else "-"
+            terms.append(f"{sign} {coef(k, abs(params[k]))}{power}")
+    return "y = " + " ".join(terms)
+
+def data_limits(series_list, spec):
+    """
+    データ点に合わせた軸範囲 ((x_min, x_max), (y_min, y_max)) (スケール後の座標系)
+    X は 5%、Y は 10% 程度のマージンをとる。系列が無い軸は None
+    """
+    if not series_list:
+        return None, None
+    x_all_min = min(s['x'].min() for s in series_list) * spec['x_factor']
+    x_all_max = max(s['x'].max() for s in series_list) * spec['x_factor']
+    margin_x = (x_all_max - x_all_min) * 0.05 if x_all_max != x_all_min else 1.0
+
+    y_all_min = min(s['y'].min() for s in series_list) * spec['y_factor']
+    y_all_max = max(s['y'].max() for s in series_list) * spec['y_factor']
+    diff = y_all_max - y_all_min
+    # マージンを10%程度とる
+    margin_y = diff * 0.1 if diff != 0 else (abs(y_all_max) * 0.1 if y_all_max != 0 else 1.0)
+    return (x_all_min - margin_x, x_all_max + margin_x), (y_all_min - margin_y, y_all_max + margin_y)
+
+def draw_scatter_axes(ax, series_list, spec, fits=None, rasterize_points=False, limits=None):
+    """
+    1 つの Axes に散布図 (＋近似直線) を描く
+    系列の dict に "index" があれば、それを fits の行番号として使う (グリッド表示で一部の系列だけ描くとき)
+    limits: data_limits() の結果。省略時はこの Axes の系列から求める
+    """
+    from tick_format import SharedExponentFormatter
+
+    # --- 副目盛りを有効化 ---
+    ax.minorticks_on() 
+    # ---------------------
+
+    ax.tick_params(direction="in", top=True, right=True, which="both")
+    
+    is_fit_plotted = False
+
+    for idx, s in enumerate(series_list):
+        x_plot = s['x'] * spec['x_factor']
+        y_plot = s['y'] * spec['y_factor']
+        fit_row = s.get('index', idx)
+        
+        base_color = COLORS[idx % len(COLORS)]
+        marker = MARKERS[idx % len(MARKERS)]
+
+        # 生データのプロット
+        points, = ax.plot(x_plot, y_plot, label=s['label_name'], color=base_color, 
+                          marker=marker, linestyle='-', linewidth=0, markersize=4, alpha=1)
+        if rasterize_points:
+            points.set_rasterized(True)
+
+        # 近似直線のプロット
+        if spec['enable_fitting'] and fits is not None:
+            for fit_idx, (f_min, f_max) in enumerate(spec['fit_configs']):
+                # 2 点未満・X が全て同じ範囲は近似できないので描かない
+                if not fits.valid[fit_row, fit_idx]:
+                    continue
+
+                params = fits.params[fit_row, fit_idx]
+                errors = fits.errors[fit_row, fit_idx] if spec.get('fit_show_errors') else None
+
+                if spec['extend_full']:
+                    x_line_min = x_plot.min()
+                    x_line_max = x_plot.max()
+                    padding = (x_line_max - x_line_min) * 0.1
+                    x_line = np.linspace(x_line_min - padding, x_line_max + padding, 100)
+                else:
+                    padding = (f_max - f_min) * 0.2
+                    x_line = np.linspace(f_min - padding, f_max + padding, 100)
+
+                y_line = fitting.evaluate(fits.model, params, x_line)
+                
+                fit_label = f"Fit{fit_idx+1}: ${fit_equation(fits.model, params, errors)}$"
+                
+                ls = LINESTYLES[fit_idx % len(LINESTYLES)]
+                
+                ax.plot(x_line, y_line, color=base_color, linestyle=ls, 
+                        linewidth=1.5, label=fit_label, alpha=0.9)
+                
+                is_fit_plotted = True
+
+    # 軸フォーマット設定 (指数は軸ごとに 1 つだけ、軸の端に表示する)
+    if not spec['auto_scale_x']:
+        if spec['global_max_x'] > 1000 or (spec['global_max_x'] < 0.001 and spec['global_max_x'] > 0):
+            ax.xaxis.set_major_formatter(SharedExponentFormatter())
+    if not spec['auto_scale_y']:
+        if spec['global_max_y'] > 1000 or (spec['global_max_y'] < 0.001 and spec['global_max_y'] > 0):
+            ax.yaxis.set_major_formatter(SharedExponentFormatter())
+
+    ax.set_xlabel(spec['x_label'])
+    ax.set_ylabel(spec['y_label'])
+    
+    # 軸範囲設定（データ点に合わせて固定）
+    x_lim, y_lim = limits if limits is not None else data_limits(series_list, spec)
+    if x_lim is not None:
+        ax.set_xlim(*x_lim)
+    if y_lim is not None:
+        ax.set_ylim(*y_lim)
+
+    # 凡例表示ロジック
+    if len(series_list) > 1 or is_fit_plotted:
+        ax.legend(bbox_to_anchor=(1, 1), loc='upper right', borderaxespad=0, fontsize=6)
+
+def draw_scatter_figure(series_list, spec, fits=None, rasterize_points=False):
+    """
+    散布図 (＋近似直線) を描画した Figure を返す
+    spec: スケール・ラベル・近似範囲などの描画設定 (dict)
+    fits: fitting.get_fits() の結果 (スケール後の座標系)
+    rasterize_points: データ点の層をラスタ化する (ベクター形式で保存するとき用)
+    """
+    # Matplotlib (と日本語フォントの登録) は実際に描画するときに初めて読み込む
+    plot_setup.configure()
+    from matplotlib.figure import Figure
+
+    # pyplot のグローバル管理に登録しない Figure を直接生成する
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    draw_scatter_axes(ax, series_list, spec, fits, rasterize_points)
+    return fig
+
+def draw_scatter_grid(series_list, spec, fits=None, rasterize_points=False):
+    """
+    系列をパネルに分けて格子状に並べた Figure を返す (spec["layout"] は make_grid_layout() の結果)
+    スケール係数・軸の書式・近似結果は全パネルで共通のものを使い、1 枚の Figure にまとめて描く
+    share_axes のときは全パネルの軸範囲をそろえ、目盛りの数値と軸ラベルは外側のパネルにだけ付ける
+    """
+    plot_setup.configure()
+    from matplotlib.figure import Figure
+
+    layout = spec['layout']
+    panels = layout['panels']
+    n_panels = len(panels)
+    ncols = max(1, min(layout['ncols'], n_panels))
+    nrows = math.ceil(n_panels / ncols)
+
+    fig = Figure(figsize=(GRID_PANEL_SIZE[0] * ncols, GRID_PANEL_SIZE[1] * nrows), layout="constrained")
+    axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+    # 全パネル共通の軸範囲は 1 回だけ求める
+    limits = data_limits(series_list, spec) if layout['share_axes'] else None
+
+    for i, ax in enumerate(axes):
+        if i >= n_panels:
+            fig.delaxes(ax)
+            continue
+        panel_series = [dict(series_list[j], index=j) for j in panels[i]]
+        draw_scatter_axes(ax, panel_series, spec, fits, rasterize_points, limits)
+        ax.set_title(layout['titles'][i], fontsize=9)
+        if layout['share_axes']:
+            # 下に別のパネルがある / 左端でないパネルは内側なので数値とラベルを省く
+            if i + ncols < n_panels:
+                ax.tick_params(labelbottom=False)
+                ax.xaxis.get_offset_text().set_visible(False)
+                ax.set_xlabel("")
+            if i % ncols != 0:
+                ax.tick_params(labelleft=False)
+                ax.yaxis.get_offset_text().set_visible(False)
+                ax.set_ylabel("")
+    return fig
+
+def draw_plot(series_list, spec, fits=None, rasterize_points=False):
+    """描画設定にグリッドの指定 (spec["layout"]) があればグリッド、なければ 1 枚の散布図を描く"""
+    if spec.get('layout'):
+        return draw_scatter_grid(series_list, spec, fits, rasterize_points)
+    return draw_scatter_figure(series_list, spec, fits, rasterize_points)
+
+
+# ---------------------------------------------------------
+# 描画パイプライン (ページ・CLI 共通)
+# ---------------------------------------------------------
+def series_from_store(store, legend_names=None):
+    """SeriesStore の各系列を描画用の dict のリストにする (配列はストアのビュー)"""
+    series_list = []
+    for i in range(len(store)):
+        x_arr, y_arr = store.series(i)
+        series_list.append({
+            "x": x_arr,
+            "y": y_arr,
+            "col_x_name": store.col_x_names[i],
+            "col_y_name": store.col_y_names[i],
+            "label_name": legend_names[i] if legend_names and i < len(legend_names) else store.col_x_names[i]
+        })
+    return series_list
+
+def make_grid_layout(series_list, ncols=GRID_DEFAULT_COLUMNS, share_axes=True, groups=None):
+    """
+    グリッド表示の設定 (make_plot_spec の layout に渡す)
+    groups: パネルに分けるシート名のリスト (SeriesStore.from_frames で作ったストアの場合)
+            省略時は 1 系列 = 1 パネル
+    """
+    if groups is None:
+        panels = [[i] for i in range(len(series_list))]
+        titles = [s['label_name'] for s in series_list]
+    else:
+        panels, titles = [], []
+        for name in groups:
+            prefix = f"{name}{FRAME_NAME_SEPARATOR}"
+            members = [i for i, s in enumerate(series_list) if s['col_x_name'].startswith(prefix)]
+            if members:
+                panels.append(members)
+                titles.append(name)
+    return {
+        "ncols": int(ncols),
+        "share_axes": bool(share_axes),
+        "panels": panels,
+        "titles": titles,
+    }
+
+def make_plot_spec(store, series_list, auto_scale_x, auto_scale_y, x_label, y_label,
+                   fit_ranges=(), extend_full=True, layout=None,
+                   fit_model="linear", fit_degree=1, fit_weighted=False, show_errors=False):
+    """
+    描画設定 (dict) を作る
+    キャッシュキーにもなるため、描画結果に影響する値をすべて含める
+    layout: グリッド表示の設定 (make_grid_layout の結果)。None なら 1 枚に重ねる
+    fit_model / fit_degree: 近似モデルと多項式の次数、fit_weighted: 誤差列で重み付けする
+    """
+    global_max_x = store.abs_max_x()
+    global_max_y = store.abs_max_y()
+    spec = {
+        "data": store.digest(),
+        "x_factor": get_auto_scale_info(global_max_x)[0] if auto_scale_x else 1.0,
+        "y_factor": get_auto_scale_info(global_max_y)[0] if auto_scale_y else 1.0,
+        "auto_scale_x": auto_scale_x,
+        "auto_scale_y": auto_scale_y,
+        "global_max_x": global_max_x,
+        "global_max_y": global_max_y,
+        "x_label": x_label,
+        "y_label": y_label,
+        "enable_fitting": bool(fit_ranges),
+        "fit_configs": [tuple(f) for f in fit_ranges],
+        "extend_full": bool(fit_ranges) and extend_full,
+        "fit_model": fit_model,
+        "fit_degree": fitting.model_degree(fit_model, fit_degree),
+        "fit_weighted": bool(fit_weighted) and store.err is not None,
+        "fit_show_errors": bool(show_errors),
+        "legend_names": [s['label_name'] for s in series_list],
+    }
+    if layout:
+        spec["layout"] = layout
+    return spec
+
+def compute_fits(store, spec):
+    """
+    全系列×全範囲の近似を一括計算する (結果は store に覚えておく)
+    重みなしの直線は累積和から範囲 1 つあたり O(log n)、それ以外も全範囲をまとめて 1 回で解く
+    """
+    if not spec["enable_fitting"] or not spec["fit_configs"]:
+        return None
+    return fitting.get_fits(
+        store, spec["fit_configs"], spec["fit_model"], spec["fit_degree"], spec["fit_weighted"],
+        spec["x_factor"], spec["y_factor"],
+    )
+
+def should_rasterize(store, threshold=RASTERIZE_POINT_THRESHOLD):
+    """ベクター形式で保存するときにデータ点をラスタ化するか (threshold <= 0 なら常にしない)"""
+    return threshold > 0 and store.x.size >= threshold
+
+def build_figure(store, options, rasterize_points=False, sheet_groups=None):
+    """
+    設定 (DEFAULT_OPTIONS と同じ形の dict) から Figure を作る
+    sheet_groups: 複数シートをまとめたストアのシート名 (grid の by: sheet で使う)
+    返り値: (Figure, 描画設定)
+    """
+    options = dict(DEFAULT_OPTIONS, **options)
+    if options["model"] not in fitting.FIT_MODELS:
+        raise ValueError(f"model は {', '.join(fitting.FIT_MODELS)} のいずれかを指定してください。")
+    series_list = series_from_store(store, options["legend"])
+    grid = options["grid"]
+    layout = None
+    if grid:
+        grid = grid if isinstance(grid, dict) else {}
+        layout = make_grid_layout(
+            series_list,
+            ncols=grid.get("ncols", GRID_DEFAULT_COLUMNS),
+            share_axes=grid.get("share_axes", True),
+            groups=sheet_groups if grid.get("by") == "sheet" else None,
+        )
+    # シートごとに並べる場合、系列名は "シート名: 列名" なので軸ラベルには元の列名を使う
+    x_name, y_name = series_list[0]['col_x_name'], series_list[0]['col_y_name']
+    if sheet_groups:
+        x_name = x_name.split(FRAME_NAME_SEPARATOR, 1)[-1]
+        y_name = y_name.split(FRAME_NAME_SEPARATOR, 1)[-1]
+    spec = make_plot_spec(
+        store, series_list,
+        auto_scale_x=options["auto_scale_x"],
+        auto_scale_y=options["auto_scale_y"],
+        x_label=options["x_label"] if options["x_label"] is not None else x_name,
+        y_label=options["y_label"] if options["y_label"] is not None else y_name,
+        fit_ranges=options["fits"] or (),
+        extend_full=options["extend_full"],
+        layout=layout,
+        fit_model=options["model"],
+        fit_degree=options["degree"],
+        fit_weighted=bool(options["error_columns"]),
+        show_errors=options["show_errors"],
+    )
+    # 近似は全パネル分をまとめて 1 回で計算する
+    fits = compute_fits(store, spec)
+    return draw_plot(series_list, spec, fits, rasterize_points), spec
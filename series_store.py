@@ -0,0 +1,175 @@
+# series_store.py
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# from_frames で系列名に付けるシート名と列名の区切り
+FRAME_NAME_SEPARATOR = ": "
+
+
+class SeriesStore:
+    """
+    複数系列の (X, Y) データを連続した float 配列で保持するストア
+    - x, y: 全系列を連結した 1 次元配列
+    - offsets: 系列 i は x[offsets[i]:offsets[i+1]] (長さ n_series + 1)
+    - 各系列は X 昇順にソート済み
+    - err: Y の誤差 (x, y と同じ並び、誤差列が無い系列・欠損は NaN)。誤差列を 1 つも使わないときは None
+    """
+
+    def __init__(self, x, y, offsets, col_x_names, col_y_names, err=None):
+        self.x = x
+        self.y = y
+        self.err = err
+        self.offsets = offsets
+        self.col_x_names = list(col_x_names)
+        self.col_y_names = list(col_y_names)
+        self._digest = None
+        # 近似計算用の累積和など、データから派生する計算結果の置き場
+        self.derived = {}
+
+    @classmethod
+    def from_frame(cls, df, col_pairs, dtype=np.float64, err_cols=None):
+        """
+        DataFrame から列ペアごとに数値化・欠損除去・X ソートして格納する
+        データが 1 点もないペアは読み飛ばす
+        err_cols: 列ペアごとの Y 誤差の列名 (使わないペアは None)
+        """
+        numeric = {}
+        for (col_x, col_y), col_err in zip(col_pairs, err_cols or [None] * len(col_pairs)):
+            # 同じ列が複数ペアで使われても変換は 1 回だけ
+            for col in (col_x, col_y, col_err):
+                if col is not None and col not in numeric:
+                    numeric[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=dtype, na_value=np.nan)
+        return cls.from_columns(numeric, col_pairs, dtype=dtype, err_cols=err_cols)
+
+    @classmethod
+    def from_frames(cls, frames, col_pairs, dtype=np.float64, err_cols=None):
+        """
+        複数の DataFrame (xlsx の各シートなど) から同じ列ペアを取り出して 1 つのストアにまとめる
+        frames: 名前 -> DataFrame。系列の列名は "名前: 列名" になる
+        列ペアが揃っていない DataFrame は読み飛ばす (誤差列が無い場合は誤差なしとして扱う)
+        """
+        numeric = {}
+        pairs = []
+        pair_errs = []
+        for name, df in frames.items():
+            for (col_x, col_y), col_err in zip(col_pairs, err_cols or [None] * len(col_pairs)):
+                if col_x not in df.columns or col_y not in df.columns:
+                    continue
+                if col_err is not None and col_err not in df.columns:
+                    col_err = None
+                keys = []
+                for col in (col_x, col_y, col_err):
+                    if col is None:
+                        keys.append(None)
+                        continue
+                    key = f"{name}{FRAME_NAME_SEPARATOR}{col}"
+                    if key not in numeric:
+                        numeric[key] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=dtype, na_value=np.nan)
+                    keys.append(key)
+                pairs.append((keys[0], keys[1]))
+                pair_errs.append(keys[2])
+        return cls.from_columns(numeric, pairs, dtype=dtype, err_cols=pair_errs)
+
+    @classmethod
+    def from_columns(cls, columns, col_pairs, dtype=np.float64, err_cols=None):
+        """
+        列名 -> 数値配列 (欠損は NaN) の dict から構築する
+        CSV のストリーミング読み込みなど、DataFrame を経由しない場合に使う
+        err_cols: 列ペアごとの Y 誤差の列名 (使わないペアは None)。誤差の欠損では点を除かない
+        """
+        err_cols = list(err_cols) if err_cols else [None] * len(col_pairs)
+        pairs = []
+        errs = []
+        for (col_x, col_y), col_err in zip(col_pairs, err_cols):
+            xs = np.asarray(columns[col_x], dtype=dtype)
+            ys = np.asarray(columns[col_y], dtype=dtype)
+            valid = ~(np.isnan(xs) | np.isnan(ys))
+            idx = np.flatnonzero(valid)
+            if idx.size == 0:
+                continue
+            order = idx[np.argsort(xs[idx], kind='stable')]
+            pairs.append((col_x, col_y, xs, ys, order))
+            errs.append(None if col_err is None else np.asarray(columns[col_err], dtype=dtype))
+
+        # 1 回の確保で全系列分の領域を用意する
+        lengths = np.array([p[4].size for p in pairs], dtype=np.int64)
+        offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        x = np.empty(offsets[-1], dtype=dtype)
+        y = np.empty(offsets[-1], dtype=dtype)
+        for i, (_, _, xs, ys, order) in enumerate(pairs):
+            lo, hi = offsets[i], offsets[i + 1]
+            np.take(xs, order, out=x[lo:hi])
+            np.take(ys, order, out=y[lo:hi])
+
+        err = None
+        if any(e is not None for e in errs):
+            err = np.full(offsets[-1], np.nan, dtype=dtype)
+            for i, es in enumerate(errs):
+                if es is not None:
+                    np.take(es, pairs[i][4], out=err[offsets[i]:offsets[i + 1]])
+
+        return cls(
+            x, y, offsets,
+            [p[0] for p in pairs],
+            [p[1] for p in pairs],
+            err=err,
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def series(self, i):
+        """系列 i の (x, y) ビュー (コピーなし)"""
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.x[lo:hi], self.y[lo:hi]
+
+    @property
+    def empty(self):
+        return self.x.size == 0
+
+    @property
+    def nbytes(self):
+        err_nbytes = self.err.nbytes if self.err is not None else 0
+        return int(self.x.nbytes + self.y.nbytes + self.offsets.nbytes + err_nbytes)
+
+    def to_arrays(self):
+        """ディスク保存用に (配列 dict, メタ情報 dict) へ分解する"""
+        arrays = {"x": self.x, "y": self.y, "offsets": self.offsets}
+        if self.err is not None:
+            arrays["err"] = self.err
+        meta = {"col_x_names": [str(c) for c in self.col_x_names],
+                "col_y_names": [str(c) for c in self.col_y_names]}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """to_arrays の逆変換 (配列はメモリマップのままでよい)"""
+        return cls(arrays["x"], arrays["y"], arrays["offsets"],
+                   meta["col_x_names"], meta["col_y_names"], err=arrays.get("err"))
+
+    def digest(self):
+        """格納データの内容ハッシュ (描画キャッシュのキー用、初回のみ計算)"""
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=20)
+            for arr in (self.offsets, self.x, self.y):
+                h.update(np.ascontiguousarray(arr).view(np.uint8))
+            if self.err is not None:
+                h.update(b"err")
+                h.update(np.ascontiguousarray(self.err).view(np.uint8))
+            self._digest = h.hexdigest()
+        return self._digest
+
+    # --- 全系列に対する集計 (ベクトル化) ---
+    def abs_max_x(self):
+        return float(np.abs(self.x).max()) if self.x.size else 0.0
+
+    def abs_max_y(self):
+        return float(np.abs(self.y).max()) if self.y.size else 0.0
+
+    def x_range(self):
+        if not self.x.size:
+            return 0.0, 0.0
+        return float(self.x.min()), float(self.x.max())
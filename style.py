@@ -1,101 +1,77 @@
 # style.py
-import streamlit as st
+import functools
+import hashlib
+import json
+import os
+import re
 
-def apply_custom_style():
-    """
-    ダークモード専用のサイバー・モダンなスタイル定義
-    """
-    st.markdown("""
-        <style>
-        /* --------------------------------------------------------- */
-        /* 1. フォントとカラー定義 (Dark Mode)                          */
-        /* --------------------------------------------------------- */
-        @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&family=Noto+Sans+JP:wght@400;500;700&family=JetBrains+Mono&display=swap');
+import streamlit as st
 
-        :root {
-            --primary-color: #8B5CF6; /* Violet */
-            --accent-gradient: linear-gradient(135deg, #8B5CF6 0%, #3B82F6 100%);
-            --card-bg: #1F2937;       /* 少し明るいダークグレー */
-            --input-bg: #111827;      /* 入力欄は暗く */
-            --text-main: #F3F4F6;
-            --text-sub: #9CA3AF;
-        }
+# ==========================================
+# 設定
+# ==========================================
+# スタイルシートの実体 (static/ は enableStaticServing により /app/static/ で配信される)
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "css", "custom.css")
+STATIC_CSS_URL = "app/static/css/custom.css"
+# "static": 配信した CSS を <link> で読み込む / "inline": 縮小した CSS を <style> で埋め込む
+STYLE_MODE = os.environ.get("SCIENCE_TOOLS_STYLE_MODE", "static")
+STYLE_ELEMENT_ID = "science-tools-style"
 
-        html, body, [class*="css"] {
-            font-family: 'Inter', 'Noto Sans JP', sans-serif;
-            color: var(--text-main);
-        }
-        
-        /* --------------------------------------------------------- */
-        /* 2. タイトル装飾 (光るグラデーション)                          */
-        /* --------------------------------------------------------- */
-        h1 {
-            font-weight: 800 !important;
-            background: var(--accent-gradient);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            padding-bottom: 10px;
-        }
-        
-        /* サイドバーのタイトルなどは白く */
-        [data-testid="stSidebar"] h1, [data-testid="stSidebar"] h2, [data-testid="stSidebar"] h3 {
-            color: var(--primary-color) !important;
-        }
+# ページの <head> にスタイルを 1 回だけ追加するスクリプト (st.html は iframe ではないので document を直接触る)
+_INJECT_JS = """
+<script>
+(function() {
+  const spec = %s;
+  const doc = document;
+  if (doc.getElementById(spec.id)) return;
+  let el;
+  if (spec.href) {
+    el = doc.createElement("link");
+    el.rel = "stylesheet";
+    el.href = spec.href;
+  } else {
+    el = doc.createElement("style");
+    el.textContent = spec.css;
+  }
+  el.id = spec.id;
+  doc.head.appendChild(el);
+})();
+</script>
+"""
 
-        /* --------------------------------------------------------- */
-        /* 3. カードデザイン (ダークな枠)                                */
-        /* --------------------------------------------------------- */
-        div[data-testid="stVerticalBlock"] > div[style*="background-color"] {
-            background-color: var(--card-bg) !important;
-            border: 1px solid #374151;
-            border-radius: 12px;
-            padding: 20px;
-            box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.3); /* 影を濃く */
-        }
+@functools.lru_cache(maxsize=1)
+def minified_css():
+    """custom.css からコメントと余分な空白を除いたもの (プロセス内で 1 回だけ作る)"""
+    with open(CSS_PATH, encoding="utf-8") as f:
+        css = f.read()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
 
-        /* --------------------------------------------------------- */
-        /* 4. UIパーツ（入力フォーム・ボタン）                           */
-        /* --------------------------------------------------------- */
-        
-        /* 入力欄（黒背景・白文字・枠線あり） */
-        .stTextInput input, .stSelectbox div[data-baseweb="select"], .stNumberInput input, .stTextArea textarea {
-            background-color: var(--input-bg) !important;
-            color: var(--text-main) !important;
-            border: 1px solid #4B5563 !important;
-            border-radius: 8px;
-        }
-        
-        /* フォーカス時に光らせる */
-        .stTextInput input:focus, .stNumberInput input:focus {
-            border-color: #8B5CF6 !important;
-            box-shadow: 0 0 0 2px rgba(139, 92, 246, 0.3);
-        }
+@functools.lru_cache(maxsize=1)
+def _css_version():
+    """ブラウザのキャッシュを内容が変わったときだけ無効にするためのハッシュ"""
+    return hashlib.blake2b(minified_css().encode("utf-8"), digest_size=6).hexdigest()
 
-        /* メインボタン (グラデーション) */
-        div.stButton > button {
-            background: var(--accent-gradient);
-            color: white !important;
-            font-weight: 600;
-            border: none;
-            padding: 0.6rem 1.2rem;
-            border-radius: 8px;
-            box-shadow: 0 4px 12px rgba(139, 92, 246, 0.4); /* 発光感 */
-            transition: all 0.3s ease;
-        }
-        div.stButton > button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 8px 16px rgba(139, 92, 246, 0.6);
-        }
+def _use_static():
+    return STYLE_MODE == "static" and st.get_option("server.enableStaticServing")
 
-        /* Expander (折りたたみ) のスタイル調整 */
-        .streamlit-expanderHeader {
-            background-color: var(--card-bg);
-            border-radius: 8px;
-        }
+def apply_custom_style():
+    """
+    ダークモード専用のサイバー・モダンなスタイル定義
+    ページの <head> に 1 回だけ追加するので、セッションの最初の描画でだけ出力する
+    (再実行のたびに CSS を送り直さない)
+    """
+    if st.session_state.get('custom_style_applied'):
+        return
+    st.session_state['custom_style_applied'] = True
 
-        /* コードブロックのフォント (JetBrains Monoなど) */
-        code {
-            font-family: 'JetBrains Mono', monospace !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    if _use_static():
+        base = st.get_option("server.baseUrlPath").strip("/")
+        href = "/" + (base + "/" if base else "") + f"{STATIC_CSS_URL}?v={_css_version()}"
+        spec = {"id": STYLE_ELEMENT_ID, "href": href}
+    else:
+        spec = {"id": STYLE_ELEMENT_ID, "css": minified_css()}
+    st.html(_INJECT_JS % json.dumps(spec, ensure_ascii=False), unsafe_allow_javascript=True)
@@ -0,0 +1,29 @@
+# tests/test_disk_cache.py
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import disk_cache
+import doi_resolver
+
+
+def test_prune_keeps_metadata_cache(tmp_path, monkeypatch):
+    """スプールの掃除 (経過時間・サイズの上限) で書誌情報のキャッシュが消されない"""
+    # 既定の配置と同じく、スプールと書誌情報キャッシュを同じ一時ディレクトリの下に置く
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(disk_cache, "SPOOL_DIR", os.path.join(str(tmp_path), "science_tools_spool"))
+
+    cache = doi_resolver.MetadataCache()
+    cache.put_many({"10.1000/abc": ("article", {"title": "T"})})
+    disk_cache.save_arrays("k", {"x": np.arange(10.0)})
+    db_files = [p for p in os.listdir(os.path.dirname(cache.path)) if p.startswith(doi_resolver.CACHE_FILE_NAME)]
+
+    disk_cache.prune(now=time.time() + 8 * 24 * 3600)
+    disk_cache.prune(max_bytes=0)
+
+    assert disk_cache.load_arrays("k") is None
+    for name in db_files:
+        assert os.path.exists(os.path.join(os.path.dirname(cache.path), name))
+    assert cache.get_many(["10.1000/abc"]) == {"10.1000/abc": ("article", {"title": "T"})}
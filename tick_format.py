@@ -0,0 +1,82 @@
+# tick_format.py
+"""
+指数表記の軸目盛り用フォーマッター (Matplotlib を読み込むので描画時にのみ import する)
+
+目盛りごとに "$1.50 \times 10^{3}$" を作ると、描画のたびに目盛りの数だけ
+log10 の計算と mathtext の解析が走る。ここでは軸全体で共通の指数を 1 回だけ求め、
+目盛りには仮数 (普通の文字列) を、軸の端には "×10^指数" を 1 つだけ表示する
+(ScalarFormatter のオフセット表示と同じ配置)
+"""
+import math
+from functools import lru_cache
+
+import matplotlib.ticker as ticker
+
+# 仮数の小数点以下の桁数 (目盛りの間隔が細かいときだけ増やす)
+MIN_DECIMALS = 2
+MAX_DECIMALS = 6
+
+
+@lru_cache(maxsize=4096)
+def mantissa_label(x, exponent, decimals):
+    """目盛り 1 つ分の文字列 (同じ値・指数の組み合わせは再計算しない)"""
+    if x == 0:
+        return "0"
+    return f"{x / 10 ** exponent:.{decimals}f}"
+
+
+@lru_cache(maxsize=64)
+def offset_label(exponent):
+    """軸の端に 1 つだけ表示する指数部 (mathtext はここだけ)"""
+    if exponent == 0:
+        return ""
+    return f"$\\times 10^{{{exponent}}}$"
+
+
+def shared_exponent(locs):
+    """目盛り全体で共通の指数 (絶対値が最大の目盛りの桁)"""
+    max_abs = max((abs(v) for v in locs), default=0.0)
+    if max_abs == 0 or not math.isfinite(max_abs):
+        return 0
+    return int(math.floor(math.log10(max_abs)))
+
+
+def mantissa_decimals(locs, exponent):
+    """隣り合う目盛りの仮数が同じ文字列にならない桁数 (MIN_DECIMALS 以上 MAX_DECIMALS 以下)"""
+    steps = [abs(b - a) for a, b in zip(locs, locs[1:]) if b != a]
+    if not steps:
+        return MIN_DECIMALS
+    step = min(steps) / 10 ** exponent
+    needed = int(math.ceil(-math.log10(step))) if step < 1 else 0
+    return min(max(MIN_DECIMALS, needed), MAX_DECIMALS)
+
+
+class SharedExponentFormatter(ticker.Formatter):
+    """
+    軸全体で指数を共通にするフォーマッター
+    目盛りの値が変わったとき (set_locs) にだけ指数と桁数を計算し直す
+    """
+
+    def __init__(self):
+        self.exponent = 0
+        self.decimals = MIN_DECIMALS
+        self._locs_key = None
+
+    def set_locs(self, locs):
+        # 表示範囲の外にある目盛り (描画されない) は指数の計算に含めない
+        if self.axis is not None:
+            vmin, vmax = sorted(self.axis.get_view_interval())
+            locs = [v for v in locs if vmin <= v <= vmax]
+        key = tuple(locs)
+        if key == self._locs_key:
+            return
+        self._locs_key = key
+        self.locs = list(locs)
+        self.exponent = shared_exponent(locs)
+        self.decimals = mantissa_decimals(sorted(locs), self.exponent)
+
+    def __call__(self, x, pos=None):
+        return mantissa_label(float(x), self.exponent, self.decimals)
+
+    def get_offset(self):
+        return offset_label(self.exponent)